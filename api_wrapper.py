@@ -1,10 +1,18 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from main import suppress_output  # ✅ reuse the same context manager
-from main import answer_question, safe_llm_init
-from embed_and_index import build_index
+from main import answer_question, stream_answer, safe_llm_init
+from query_cache import answer_cache
+from fast_path import fast_path
+from llm_worker import GenerationPool, QueueFullError, resolve_pool_shape
+from embed_and_index import get_or_build_index
+from retrieval import build_retriever
 from auth.user_auth import signup, login, init_user_table
-from config import DB_PATH, INDEX_PATH
+from config import DB_PATH, INDEX_PATH, LLM_QUEUE_SIZE, LLM_POOL_SIZE, LLM_THREADS
+from llama_index.core.settings import Settings
+import itertools
+import json
 import logging
 import os
 import logging
@@ -39,8 +47,18 @@ init_user_table()
 
 # ==== Load once ====
 with suppress_output():
-   model = safe_llm_init()
-   index = build_index(db_path=DB_PATH, persist_path=INDEX_PATH)
+   # Each engine is owned by one pool thread; requests queue up for the next free one
+   pool_size, llm_threads = resolve_pool_shape(LLM_POOL_SIZE, LLM_THREADS)
+   model = GenerationPool(
+       [safe_llm_init(n_threads=llm_threads) for _ in range(pool_size)],
+       max_queue_size=LLM_QUEUE_SIZE,
+   )
+   index = get_or_build_index(db_path=DB_PATH, persist_path=INDEX_PATH)
+   retriever = build_retriever(index)
+   # Entity names for questions answered straight from SQLite
+   fast_path.load()
+   # Concurrent /ask requests share embedding forward passes
+   query_batcher = Settings.embed_model.enable_query_batching()
 
 # ==== Request Models ====
 class AuthRequest(BaseModel):
@@ -56,6 +74,16 @@ class QuestionRequest(BaseModel):
 def health_check():
     return {"status": "ok"}
 
+@app.get("/stats")
+def runtime_stats():
+    return {
+        "fast_path": fast_path.stats(),
+        "query_embedding_batches": query_batcher.stats(),
+        "query_embedding_cache": Settings.embed_model.query_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "llm_queue": model.stats(),
+    }
+
 @app.post("/signup")
 def api_signup(data: AuthRequest):
     if signup(data.username, data.password):
@@ -74,15 +102,51 @@ def api_login(data: AuthRequest):
         logger.warning(f"Login failed for user '{data.username}'")
         raise HTTPException(status_code=401, detail="Invalid credentials.")
 
+def busy_error(e: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please retry shortly.",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
 @app.post("/ask")
 def api_ask(req: QuestionRequest):
     try:
-        response = answer_question(index, req.question, model)
+        response = answer_question(retriever, req.question, model)
         logger.info(f"Question: {req.question} → Answer: {response}")
         return {"answer": response}
+    except QueueFullError as e:
+        logger.warning(f"Rejected question, generation queue full: {req.question}")
+        raise busy_error(e)
     except Exception as e:
         logger.exception("Error while answering question.")
         raise HTTPException(status_code=500, detail="Error generating response")
+
+@app.post("/ask/stream")
+def api_ask_stream(req: QuestionRequest):
+    """Server-Sent Events: `token` events while decoding, then one `answer` event with the final text."""
+    answer_events = stream_answer(retriever, req.question, model)
+    try:
+        # Run retrieval and queue admission now, so a full queue is still a 503
+        first_event = next(answer_events)
+    except QueueFullError as e:
+        logger.warning(f"Rejected question, generation queue full: {req.question}")
+        raise busy_error(e)
+    except Exception:
+        logger.exception("Error while streaming answer.")
+        raise HTTPException(status_code=500, detail="Error generating response")
+
+    def events():
+        try:
+            for kind, text in itertools.chain([first_event], answer_events):
+                if kind == "answer":
+                    logger.info(f"Question: {req.question} → Answer: {text}")
+                yield f"event: {kind}\ndata: {json.dumps({'text': text})}\n\n"
+        except Exception:
+            logger.exception("Error while streaming answer.")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Error generating response'})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
     
 # ==== Dev server entry ====
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark MistralEngine settings on this machine and write the fastest profile.
+
+Sweeps threads x batch size, measuring prompt-eval and decode tokens/sec, and saves
+the combination with the lowest estimated time per answer to LLM_PROFILE_PATH,
+which config.py picks up on the next start.
+"""
+
+import argparse
+import json
+import os
+import time
+
+from config import MODEL_PATH, LLM_PROFILE_PATH, LLM_N_CTX, LLM_USE_MMAP, LLM_USE_MLOCK, LLM_MAX_TOKENS
+from main import PROMPT_PREAMBLE, suppress_output
+from models.Mistral.mistral_engine import MistralEngine
+
+# Roughly the shape of a real request: preamble, question and a few retrieved records
+SAMPLE_PROMPT = PROMPT_PREAMBLE + """### Student's Question:
+My wheat leaves have yellow stripes of powder. What should I spray and when?
+
+### Factual Context:
+""" + "\n\n".join(
+    "Record from plant_diseases table:\n"
+    "Disease name: Stripe rust\n"
+    "Crop affected: Wheat\n"
+    "Symptoms: Yellow to orange stripes of pustules on leaves, reduced grain filling\n"
+    "Treatment: Spray propiconazole or tebuconazole at first appearance, repeat after 15 days\n"
+    "Prevention: Sow resistant varieties, avoid late sowing, remove volunteer wheat plants"
+    for _ in range(4)
+) + "\n\n### Answer:\n"
+
+
+def default_thread_counts():
+    cpus = os.cpu_count() or 1
+    counts = {cpus, max(1, cpus // 2)}
+    n = 1
+    while n < cpus:
+        counts.add(n)
+        n *= 2
+    return sorted(counts)
+
+
+def parse_ints(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def benchmark(n_threads, n_batch, args):
+    with suppress_output():
+        engine = MistralEngine(
+            model_path=args.model,
+            n_threads=n_threads,
+            n_ctx=args.ctx,
+            n_batch=n_batch,
+            use_mmap=LLM_USE_MMAP,
+            use_mlock=LLM_USE_MLOCK,
+            max_tokens=args.decode_tokens,
+        )
+        llm = engine.llm
+        tokens = llm.tokenize(SAMPLE_PROMPT.encode("utf-8"))
+
+        llm.reset()
+        start = time.perf_counter()
+        llm.eval(tokens)
+        prompt_seconds = time.perf_counter() - start
+
+        # The prompt is now cached, so this call only pays for decoding
+        start = time.perf_counter()
+        output = llm(SAMPLE_PROMPT, max_tokens=args.decode_tokens)
+        decode_seconds = time.perf_counter() - start
+    del engine
+
+    decoded = max(1, output["usage"]["completion_tokens"])
+    prompt_tps = len(tokens) / prompt_seconds
+    decode_tps = decoded / decode_seconds
+    return {
+        "prompt_tokens": len(tokens),
+        "prompt_tokens_per_sec": round(prompt_tps, 2),
+        "decode_tokens_per_sec": round(decode_tps, 2),
+        # Estimated latency of one answer of the configured max length
+        "seconds_per_answer": round(len(tokens) / prompt_tps + args.max_tokens / decode_tps, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the fastest MistralEngine settings for this machine.")
+    parser.add_argument("--model", default=MODEL_PATH, help="GGUF model to benchmark")
+    parser.add_argument("--threads", type=parse_ints, default=default_thread_counts(),
+                        help="comma-separated thread counts to try")
+    parser.add_argument("--batch", type=parse_ints, default=[32, 64, 128, 256, 512],
+                        help="comma-separated n_batch values to try")
+    parser.add_argument("--ctx", type=int, default=LLM_N_CTX, help="context size to benchmark and save")
+    parser.add_argument("--max-tokens", type=int, default=LLM_MAX_TOKENS, help="max_tokens to save in the profile")
+    parser.add_argument("--decode-tokens", type=int, default=64, help="tokens to decode per measurement")
+    parser.add_argument("--output", default=LLM_PROFILE_PATH, help="where to write the profile")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model file missing: {args.model}")
+        return
+
+    print(f"{'threads':>8} {'batch':>6} {'prompt tok/s':>13} {'decode tok/s':>13} {'s/answer':>9}")
+    results = []
+    for n_threads in args.threads:
+        for n_batch in args.batch:
+            try:
+                result = benchmark(n_threads, n_batch, args)
+            except Exception as e:
+                print(f"[!] threads={n_threads} batch={n_batch} failed: {e}")
+                continue
+            result.update({"threads": n_threads, "batch": n_batch})
+            results.append(result)
+            print(f"{n_threads:>8} {n_batch:>6} {result['prompt_tokens_per_sec']:>13} "
+                  f"{result['decode_tokens_per_sec']:>13} {result['seconds_per_answer']:>9}")
+
+    if not results:
+        print("❌ No configuration completed.")
+        return
+
+    best = min(results, key=lambda r: r["seconds_per_answer"])
+    profile = {
+        "LLM_THREADS": best["threads"],
+        "LLM_N_BATCH": best["batch"],
+        "LLM_N_CTX": args.ctx,
+        "LLM_USE_MMAP": LLM_USE_MMAP,
+        "LLM_USE_MLOCK": LLM_USE_MLOCK,
+        "LLM_MAX_TOKENS": args.max_tokens,
+        "benchmark": {"cpu_count": os.cpu_count(), "best": best, "results": results},
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    print(f"✅ Best: threads={best['threads']} batch={best['batch']} "
+          f"({best['seconds_per_answer']}s per answer). Profile written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Rebuild the vector index offline, embedding on every core of the build machine.
+
+Rows are streamed from the database exactly as in embed_and_index.build_index(); only
+the embedding is spread over a pool of worker processes, each running its own E5 model
+(EMBED_BACKEND) with a bounded number of threads. Vectors come back to this process and go into
+one persisted index, the same one a normal start would build.
+"""
+
+import argparse
+import multiprocessing
+from multiprocessing.pool import Pool
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from config import DB_PATH, INDEX_PATH, EMBED_MODEL_NAME, EMBED_BATCH_SIZE, INDEX_CHUNK_SIZE
+from embed_and_index import build_index, new_embed_model
+
+# The model of the current worker process, loaded once by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    _worker_model = new_embed_model(model_name, threads)
+
+
+def _embed_shard(texts) -> np.ndarray:
+    return _worker_model._embed_batch(texts)
+
+
+class PooledEmbedding(BaseEmbedding):
+    """Embeds each batch of texts by splitting it across worker processes."""
+
+    model_name: str = EMBED_MODEL_NAME
+    workers: int = 1
+    _pool: Optional[Pool] = None
+
+    def __init__(self, workers, threads, model_name=EMBED_MODEL_NAME):
+        # One call per table chunk, so every worker gets a share of it
+        super().__init__(model_name=model_name, workers=workers, embed_batch_size=min(INDEX_CHUNK_SIZE, 2048))
+        # spawn, not fork: each worker starts its own thread pools from scratch
+        context = multiprocessing.get_context("spawn")
+        self._pool = context.Pool(workers, initializer=_init_worker, initargs=(model_name, threads))
+        # Wait for the models to load, so it doesn't count against embedding throughput
+        start = time.perf_counter()
+        self._pool.map(_embed_shard, [["warm up"]] * workers, chunksize=1)
+        print(f"{workers} embedding processes ready in {time.perf_counter() - start:.1f}s")
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        shard_count = max(1, min(self.workers, len(texts) // EMBED_BATCH_SIZE))
+        # Deal texts out by length so every shard costs about the same
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        shards = [order[i::shard_count] for i in range(shard_count)]
+        results = self._pool.map(_embed_shard, [[texts[i] for i in shard] for shard in shards])
+
+        embeddings = [None] * len(texts)
+        for shard, vectors in zip(shards, results):
+            for i, vector in zip(shard, vectors):
+                embeddings[i] = vector.tolist()
+        return embeddings
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Rebuild the vector index using a pool of embedding processes.")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database to index")
+    parser.add_argument("--index", default=INDEX_PATH, help="where to write the index")
+    parser.add_argument("--workers", type=int, default=max(1, cpu_count // 2), help="embedding processes")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="embedding threads per process (default: cores / workers)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database missing: {args.db}")
+        return
+
+    threads = args.threads or max(1, cpu_count // args.workers)
+    print(f"Embedding with {args.workers} processes x {threads} threads")
+    embed_model = PooledEmbedding(args.workers, threads)
+    try:
+        build_index(args.db, args.index, embed_model=embed_model)
+    finally:
+        embed_model.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,128 @@
+import json
+import os
+
 MODEL_PATH = "C:/Users/Prakhar Srivastava/Desktop/AskQuery/models/Mistral/mistral-7b-instruct-v0.2.Q4_K_M.gguf"
 DB_PATH = "database/trial1.db"
-INDEX_PATH = "faiss_index"
\ No newline at end of file
+INDEX_PATH = "faiss_index"
+
+# Embedding model used for both indexing and queries
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "intfloat/e5-small-v2")
+# What runs it: "torch" (PyTorch + transformers), "onnx" (ONNX Runtime, see onnx_embedding.py)
+# or "gguf" (llama.cpp, see gguf_embedding.py)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+
+# Startup behaviour: "auto" reuses the persisted index when it matches the database,
+# "rebuild" always re-embeds everything, "readonly" only opens an existing index (for
+# multi-worker servers sharing an index built beforehand)
+INDEX_STARTUP_MODE = os.getenv("INDEX_STARTUP_MODE", "auto")
+
+# Texts per embedding forward pass when indexing
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+
+# Micro-batching of query embeddings across concurrent API requests
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "16"))
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "2"))
+
+# Cached query embeddings, keyed on the normalized question (0 disables)
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "4096"))
+
+# Answer cache in front of retrieval + generation
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+# Cosine similarity at which a different question reuses a cached answer (>1 disables)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.97"))
+
+# Generations allowed to wait for the LLM before the API answers 503
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "8"))
+
+# Mistral engine settings. A profile written by `python autotune.py` overrides the
+# defaults below, and environment variables override the profile.
+LLM_PROFILE_PATH = os.getenv("LLM_PROFILE_PATH", "llm_profile.json")
+
+def _load_llm_profile(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+_llm_profile = _load_llm_profile(LLM_PROFILE_PATH)
+
+def _llm_setting(name, default):
+    return os.getenv(name, _llm_profile.get(name, default))
+
+# Mistral instances served in parallel and threads per instance ("auto" sizes both from the CPU count)
+LLM_POOL_SIZE = str(_llm_setting("LLM_POOL_SIZE", "auto"))
+LLM_THREADS = str(_llm_setting("LLM_THREADS", "auto"))
+LLM_N_CTX = int(_llm_setting("LLM_N_CTX", 2048))
+LLM_N_BATCH = int(_llm_setting("LLM_N_BATCH", 512))  # Prompt tokens evaluated per llama.cpp batch
+LLM_USE_MMAP = str(_llm_setting("LLM_USE_MMAP", "true")).lower() == "true"
+LLM_USE_MLOCK = str(_llm_setting("LLM_USE_MLOCK", "false")).lower() == "true"
+LLM_MAX_TOKENS = int(_llm_setting("LLM_MAX_TOKENS", 512))
+
+
+# Retrieval candidates, trimmed at the first score drop larger than CONTEXT_SCORE_GAP
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+CONTEXT_SCORE_GAP = float(os.getenv("CONTEXT_SCORE_GAP", "0.05"))
+# Max prompt tokens spent on retrieved context (always capped by what fits in LLM_N_CTX)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1024"))
+
+# Table routing: search at most ROUTER_MAX_TABLES per-table sub-indexes, those scoring
+# within ROUTER_MARGIN of the best (centroid similarity + ROUTER_KEYWORD_BOOST per keyword)
+ROUTER_MAX_TABLES = int(os.getenv("ROUTER_MAX_TABLES", "2"))
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.03"))
+ROUTER_KEYWORD_BOOST = float(os.getenv("ROUTER_KEYWORD_BOOST", "0.05"))
+
+# Hybrid retrieval: fuse FTS5/BM25 hits with vector hits (reciprocal rank fusion)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+LEXICAL_TOP_K = int(os.getenv("LEXICAL_TOP_K", "6"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Structured fast path: answer "<field> of <entity>" questions (e.g. "treatment for powdery
+# mildew") from a template over SQLite, without retrieval or the LLM. Longer questions skip it.
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+FAST_PATH_MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", "12"))
+
+# Tables never indexed or searched: the auth tables hold usernames and password hashes
+INDEX_EXCLUDED_TABLES = frozenset(
+    name.strip() for name in os.getenv("INDEX_EXCLUDED_TABLES", "users,user_preferences").split(",") if name.strip()
+)
+
+# Bytes of the SQLite database memory-mapped while loading rows (0 disables mmap)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Streaming index builds: rows fetched from SQLite per batch, and rows split, embedded
+# and inserted per chunk, so memory stays bounded however large the database is
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "1000"))
+INDEX_CHUNK_SIZE = int(os.getenv("INDEX_CHUNK_SIZE", "2048"))
+
+# Longest node text (characters, roughly 4 per token). Rows up to this size are embedded
+# as one node; longer rows are split along field boundaries (E5 reads at most 512 tokens).
+NODE_MAX_CHARS = int(os.getenv("NODE_MAX_CHARS", "1500"))
+
+# FAISS index behind each table: "flat" (exact), "hnsw" (graph, approximate) or "ivfpq"
+# (inverted lists + product quantization, smallest). FAISS_STORAGE keeps flat/hnsw vectors
+# as "fp32", "fp16" or "int8"; ivfpq always stores PQ codes.
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_STORAGE = os.getenv("FAISS_STORAGE", "fp32")
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "256"))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))  # Must divide the embedding size (384 for e5-small)
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", "8"))
+# ivfpq and int8 need training data: a table stays exact fp32 until it has this many vectors
+FAISS_TRAIN_MIN = int(os.getenv("FAISS_TRAIN_MIN", "10000"))
+# Memory-map persisted indexes instead of reading them into RAM (needs faiss 1.11+, else logged and read)
+FAISS_MMAP = os.getenv("FAISS_MMAP", "true").lower() == "true"
+
+# ONNX embedding backend: where `python onnx_embedding.py` writes the exported model,
+# whether to serve the int8-quantized copy, and the lowest cosine similarity to the
+# PyTorch embeddings the export must reach to pass its parity check
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models/e5-onnx")
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "true").lower() == "true"
+ONNX_PARITY_MIN_COSINE = float(os.getenv("ONNX_PARITY_MIN_COSINE", "0.99"))
+
+# GGUF conversion of EMBED_MODEL_NAME for the llama.cpp embedding backend
+GGUF_EMBED_MODEL_PATH = os.getenv("GGUF_EMBED_MODEL_PATH", "models/e5-small-v2-f16.gguf")
@@ -0,0 +1,90 @@
+from query_cache import normalize_query
+
+RECORD_HEADER_PREFIX = "Record from "
+# Short "Field: value" lines are facts about their own record and are never dropped;
+# only joined lines and longer text are checked for repeats
+MIN_DEDUP_WORDS = 8
+
+
+def select_top_k(nodes, max_k: int, max_gap: float, min_k: int = 1):
+    """Keep the best-scoring nodes up to the first score drop larger than `max_gap`.
+
+    The kept nodes stay in the order given, so a retriever's own ranking (e.g. fused
+    lexical + dense rank) survives; for pure vector search that is score order anyway.
+    """
+    ranked = sorted(range(len(nodes)), key=lambda i: nodes[i].score or 0.0, reverse=True)[:max_k]
+    for i in range(max(1, min_k), len(ranked)):
+        if (nodes[ranked[i - 1]].score or 0.0) - (nodes[ranked[i]].score or 0.0) > max_gap:
+            ranked = ranked[:i]
+            break
+    return [nodes[i] for i in sorted(ranked)]
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def pack_context(nodes, count_tokens, budget: int, near_duplicate: float = 0.9) -> str:
+    """Join node texts in the given order, dropping repeats and stopping at `budget` tokens.
+
+    A record that is a copy of one already packed under another key (the same record_hash
+    and chunk, or `near_duplicate` of the same words) is skipped whole.
+    Within the rest, foreign-key join lines and long text lines are dropped when they repeat, or share
+    `near_duplicate` of their words with a line already packed (e.g. splitter overlap);
+    record headers and short field lines are always kept. A record that would overflow
+    the budget is cut at a line boundary, and packing stops there.
+    """
+    seen = set()
+    kept_words = []
+    seen_records = set()
+    kept_record_words = []
+    blocks = []
+    used = 0
+
+    for node in nodes:
+        # Copies of a record are chunked alike, so chunk n of each has the same record_hash
+        record = (node.node.metadata.get("record_hash"), node.node.node_id.rpartition("#")[2])
+        record_words = set(normalize_query(node.node.text).split())
+        if (record[0] is not None and record in seen_records) or any(
+            _jaccard(record_words, w) >= near_duplicate for w in kept_record_words
+        ):
+            continue  # Same record stored under another key
+        seen_records.add(record)
+        kept_record_words.append(record_words)
+
+        lines = []
+        for line in node.node.text.splitlines():
+            key = normalize_query(line)
+            if not key:
+                continue
+            words = set(key.split())
+            if " (from " in line or len(words) >= MIN_DEDUP_WORDS:
+                if key in seen or any(_jaccard(words, w) >= near_duplicate for w in kept_words):
+                    continue
+                seen.add(key)
+                kept_words.append(words)
+            lines.append(line)
+
+        if not lines or (len(lines) == 1 and lines[0].startswith(RECORD_HEADER_PREFIX)):
+            continue  # Nothing new in this record
+
+        block = "\n".join(lines)
+        cost = count_tokens(block + "\n\n")
+        if used + cost <= budget:
+            blocks.append(block)
+            used += cost
+            continue
+
+        # Fit as many whole lines of this record as the remaining budget allows
+        partial = []
+        for line in lines:
+            line_cost = count_tokens(line + "\n")
+            if used + line_cost > budget:
+                break
+            partial.append(line)
+            used += line_cost
+        if len(partial) > 1:
+            blocks.append("\n".join(partial))
+        break
+
+    return "\n\n".join(blocks)
@@ -1,24 +1,42 @@
-from transformers import AutoTokenizer, AutoModel
-import torch
 import numpy as np
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.vector_stores.faiss.base import FaissVectorStore
 from llama_index.core import VectorStoreIndex, load_index_from_storage
 from llama_index.core.storage.storage_context import StorageContext
 from llama_index.core.settings import Settings
-from llama_index.embeddings.openai.base import BaseEmbedding
-from config import DB_PATH, INDEX_PATH
-from sqlite_loader import get_sqlite_db
-from typing import Optional
+from config import DB_PATH, INDEX_PATH, EMBED_MODEL_NAME, EMBED_BATCH_SIZE, EMBED_BACKEND, INDEX_STARTUP_MODE, INDEX_CHUNK_SIZE, NODE_MAX_CHARS
+from embedding_base import E5Embedding
+from sqlite_loader import iter_sqlite_documents
+from query_cache import answer_cache
+from retrieval import KEYWORD_SAMPLE_ROWS, table_keywords
+from lexical_index import LexicalIndex, LexicalIndexWriter
+from node_builder import build_nodes
+from faiss_store import FaissStore, faiss_settings
+from sqlite_kvstore import sqlite_storage
+from typing import List, Optional
+from itertools import islice
+import json
+import os
+import shutil
+import time
 
+# Bump when the on-disk layout or chunking changes so old indexes get rebuilt
+INDEX_FORMAT_VERSION = 14
+INDEX_META_FILE = "index_meta.json"
+TABLES_DIR = "tables"  # One persisted sub-index per source table
 
-class E5SmallV2Embedding(BaseEmbedding):
-    model_name: str = "intfloat/e5-small-v2"
-    _tokenizer: Optional[AutoTokenizer] = None
-    _model: Optional[AutoModel] = None
+class E5SmallV2Embedding(E5Embedding):
+    """E5 on PyTorch. torch and transformers are imported here, not at module import,
+    so a process serving with another EMBED_BACKEND never loads them."""
 
-    def __init__(self, model_name="intfloat/e5-small-v2"):
-        super().__init__(model_name=model_name)
+    _tokenizer: Optional[object] = None
+    _model: Optional[object] = None
+
+    def __init__(self, model_name=EMBED_MODEL_NAME, batch_size=EMBED_BATCH_SIZE, threads=None):
+        import torch
+        from transformers import AutoTokenizer, AutoModel
+
+        super().__init__(model_name=model_name, batch_size=batch_size)
+        if threads:
+            torch.set_num_threads(threads)
         print(f"Loading embedding model: {model_name} on CPU")
         self._tokenizer = AutoTokenizer.from_pretrained(model_name)
         self._model = AutoModel.from_pretrained(model_name)
@@ -29,43 +47,315 @@ class E5SmallV2Embedding(BaseEmbedding):
         input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
         return (token_embeddings * input_mask_expanded).sum(1) / input_mask_expanded.sum(1)
 
-    def _get_embedding(self, text: str) -> np.ndarray:
-        encoded_input = self._tokenizer(text, padding=True, truncation=True, return_tensors="pt")
+    def _tokenize(self, texts: List[str]) -> dict:
+        return dict(self._tokenizer(texts, truncation=True))
+
+    def _encode(self, features: dict) -> np.ndarray:
+        import torch
+
+        encoded_input = self._tokenizer.pad(features, padding=True, return_tensors="pt")
         encoded_input = {k: v.to("cpu") for k, v in encoded_input.items()}
-        with torch.no_grad():
+        with torch.inference_mode():
             model_output = self._model(**encoded_input)
-        embedding = self._mean_pooling(model_output, encoded_input['attention_mask'])
-        embedding = torch.nn.functional.normalize(embedding, p=2, dim=1)
-        return embedding[0].cpu().numpy()
+            embeddings = self._mean_pooling(model_output, encoded_input['attention_mask'])
+            embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+        return embeddings.cpu().numpy()
 
-    def _get_text_embedding(self, text: str) -> np.ndarray:
-        return self._get_embedding(text)
 
-    def _get_query_embedding(self, query: str) -> np.ndarray:
-        return self._get_embedding(query)
+def new_embed_model(model_name=EMBED_MODEL_NAME, threads=None) -> E5Embedding:
+    """The E5 embedding for EMBED_BACKEND; threads caps the backend's CPU threads."""
+    if EMBED_BACKEND == "onnx":
+        from onnx_embedding import OnnxE5Embedding
+        return OnnxE5Embedding(model_name, threads=threads)
+    if EMBED_BACKEND == "gguf":
+        from gguf_embedding import GgufE5Embedding
+        return GgufE5Embedding(model_name, threads=threads)
+    return E5SmallV2Embedding(model_name, threads=threads)
 
-    async def _aget_query_embedding(self, query: str) -> np.ndarray:
-        return self._get_embedding(query)
 
+def read_index_meta(persist_path=INDEX_PATH) -> dict:
+    meta_path = os.path.join(persist_path, INDEX_META_FILE)
+    if not os.path.exists(meta_path):
+        return {}
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[!] Could not read index metadata: {e}")
+        return {}
 
-def build_index(db_path=DB_PATH, persist_path=INDEX_PATH):
-    print("Building index from SQLite database...")
-    documents = get_sqlite_db(db_path)
+def write_index_meta(model_name, profiles, persist_path=INDEX_PATH):
+    # Row hashes are not kept here but in each table's storage.db (doc_hashes)
+    meta = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "model_name": model_name,
+        "vector_store": faiss_settings(),
+        "node_max_chars": NODE_MAX_CHARS,
+        "tables": profiles,
+    }
+    with open(os.path.join(persist_path, INDEX_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+def group_by_table(documents) -> dict:
+    groups = {}
+    for doc in documents:
+        groups.setdefault(doc.metadata["table"], []).append(doc)
+    return groups
+
+def iter_chunks(documents, size=INDEX_CHUNK_SIZE):
+    documents = iter(documents)
+    while chunk := list(islice(documents, size)):
+        yield chunk
+
+
+class RowScan:
+    """What one pass over the source rows leaves behind: the row count, a few sample rows per
+    table (for routing keywords) and, when scanning against an index, the rows to re-embed.
+
+    Row hashes are diffed against each table's doc_hashes in SQL, a chunk at a time, so
+    memory grows only with the rows that changed.
+    """
+
+    def __init__(self, index=None):
+        self.index = index
+        self.count = 0
+        self.samples = {}  # table -> first KEYWORD_SAMPLE_ROWS documents
+        self.changed = []  # documents that are new or whose content hash changed
+        self.stale_ids = []  # indexed rows that changed or are gone from the database
+
+    def add(self, doc):
+        self.count += 1
+        samples = self.samples.setdefault(doc.metadata["table"], [])
+        if len(samples) < KEYWORD_SAMPLE_ROWS:
+            samples.append(doc)
+
+    def diff(self, chunk):
+        for table, table_docs in group_by_table(chunk).items():
+            if table not in self.index.indexes:
+                self.changed.extend(table_docs)
+                continue
+            indexed = self.index.indexes[table].docstore.scan_document_hashes(
+                {doc.doc_id: doc.metadata["content_hash"] for doc in table_docs}
+            )
+            for doc in table_docs:
+                if doc.doc_id in indexed:
+                    self.changed.append(doc)
+                    if indexed[doc.doc_id] is not None:
+                        self.stale_ids.append(doc.doc_id)
+
+    def read(self, documents):
+        """Scan every row against the index."""
+        for chunk in iter_chunks(documents):
+            for doc in chunk:
+                self.add(doc)
+            self.diff(chunk)
+        for table_index in self.index.indexes.values():
+            self.stale_ids.extend(table_index.docstore.unscanned_document_ids())
+        return self
+
+    def scan(self, documents):
+        """Pass documents through, recording each one."""
+        for doc in documents:
+            self.add(doc)
+            yield doc
+
+
+class PartitionedIndex:
+    """One VectorStoreIndex per source table, plus the routing profile of each table.
+
+    A profile holds the table's embedding centroid and keywords (see retrieval.TableRouter),
+    so a query only has to search the partitions it is routed to.
+    """
+
+    def __init__(self, indexes: dict, profiles: dict, lexical=None):
+        self.indexes = indexes
+        self.profiles = profiles
+        self.lexical = lexical  # LexicalIndex over the same rows, if FTS5 is available
+
+    def persist(self, persist_path=INDEX_PATH, tables=None):
+        for table in tables if tables is not None else self.indexes:
+            self.indexes[table].storage_context.persist(persist_dir=table_persist_dir(persist_path, table))
+
+    def nodes_for_doc(self, doc_id):
+        """All nodes split from one source row."""
+        index = self.indexes.get(doc_id.split(":", 1)[0])
+        info = index.docstore.get_ref_doc_info(doc_id) if index is not None else None
+        return index.docstore.get_nodes(info.node_ids) if info is not None else []
+
+    def node_vector(self, node):
+        index = self.indexes.get(node.metadata.get("table"))
+        return index.vector_store.get(node.node_id) if index is not None else None
 
-    # Tune for fewer chunks = faster retrieval
-    splitter = SentenceSplitter(chunk_size=512, chunk_overlap=50)
-    nodes = splitter.get_nodes_from_documents(documents)
+    def refresh_profile(self, table, documents):
+        centroid = self.indexes[table].vector_store.mean_vector()
+        norm = np.linalg.norm(centroid)
+        self.profiles[table] = {
+            "centroid": (centroid / norm if norm else centroid).tolist(),
+            "keywords": sorted(table_keywords(table, documents)),
+        }
 
-    embed_model = E5SmallV2Embedding()
+
+def table_persist_dir(persist_path, table):
+    return os.path.join(persist_path, TABLES_DIR, table)
+
+# Vectors live in a memory-mapped FAISS file and nodes, keyed by vector ID, in a memory-mapped
+# SQLite file, so worker processes opening the same index share one page-cached copy of both
+def new_table_index(nodes, persist_dir):
+    docstore, index_store = sqlite_storage(persist_dir)
+    storage_context = StorageContext.from_defaults(
+        docstore=docstore, index_store=index_store, vector_store=FaissStore(docstore)
+    )
+    return VectorStoreIndex(nodes, storage_context=storage_context)
+
+def load_table_index(persist_dir, readonly=False):
+    docstore, index_store = sqlite_storage(persist_dir, readonly)
+    storage_context = StorageContext.from_defaults(
+        docstore=docstore, index_store=index_store, vector_store=FaissStore.from_persist_dir(persist_dir, docstore)
+    )
+    index = load_index_from_storage(storage_context)
+    index_store.persist()  # Loading re-saves the index struct; don't hold the write lock
+    return index
+
+def add_documents(index, documents, persist_path=INDEX_PATH) -> set:
+    """Split, embed and insert rows into their per-table sub-indexes; returns the tables touched."""
+    touched = set()
+    for table, table_docs in group_by_table(documents).items():
+        nodes = build_nodes(table_docs)
+        if table in index.indexes:
+            index.indexes[table].insert_nodes(nodes)
+        else:
+            index.indexes[table] = new_table_index(nodes, table_persist_dir(persist_path, table))
+        index.indexes[table].docstore.set_document_hashes(
+            {doc.doc_id: doc.metadata["content_hash"] for doc in table_docs}
+        )
+        touched.add(table)
+    return touched
+
+def build_index(db_path=DB_PATH, persist_path=INDEX_PATH, documents=None, embed_model=None):
+    """Embed every row, INDEX_CHUNK_SIZE rows at a time, straight from a stream of documents.
+
+    embed_model defaults to an in-process new_embed_model(); build_index.py passes one
+    that spreads the work over several processes.
+    """
+    print("Building index from SQLite database...")
+    if documents is None:
+        documents = iter_sqlite_documents(db_path)
+
+    if embed_model is None:
+        embed_model = new_embed_model()
     Settings.embed_model = embed_model
+    start = time.perf_counter()
 
-    index = VectorStoreIndex(nodes)
-    index.storage_context.persist(persist_dir=persist_path)
-    print(f"Index saved to {persist_path}")
+    shutil.rmtree(os.path.join(persist_path, TABLES_DIR), ignore_errors=True)
+    os.makedirs(persist_path, exist_ok=True)
+    index = PartitionedIndex({}, {})
+    lexical = LexicalIndexWriter.create(persist_path)
+    scan = RowScan()
+    for chunk in iter_chunks(scan.scan(documents)):
+        add_documents(index, chunk, persist_path)
+        if lexical is not None:
+            lexical.add(chunk)
+        elapsed = time.perf_counter() - start
+        print(f"  {scan.count} rows embedded ({scan.count / elapsed:.1f} rows/s)")
+    for table in index.indexes:
+        index.refresh_profile(table, scan.samples[table])
+
+    index.persist(persist_path)
+    if lexical is not None:
+        lexical.commit()
+    index.lexical = LexicalIndex.open(persist_path)
+    write_index_meta(embed_model.model_name, index.profiles, persist_path)
+    answer_cache.invalidate()
+    print(f"Index saved to {persist_path} ({len(index.indexes)} tables, "
+          f"{scan.count} rows in {time.perf_counter() - start:.1f}s)")
 
     return index
 
-def load_index(persist_path=INDEX_PATH):
-    embed_model = E5SmallV2Embedding()
+def load_index(persist_path=INDEX_PATH, profiles=None, readonly=False):
+    embed_model = new_embed_model()
     Settings.embed_model = embed_model
-    return load_index_from_storage(StorageContext.from_defaults(persist_dir=persist_path))
+    if profiles is None:
+        profiles = read_index_meta(persist_path).get("tables", {})
+
+    indexes = {table: load_table_index(table_persist_dir(persist_path, table), readonly) for table in profiles}
+    return PartitionedIndex(indexes, dict(profiles), LexicalIndex.open(persist_path))
+
+def update_index(index, scan: RowScan, persist_path=INDEX_PATH):
+    """Re-embed only the rows whose content hash changed since the index was persisted."""
+    stale_ids = scan.stale_ids
+    touched = set()
+
+    for doc_id in stale_ids:
+        table = doc_id.split(":", 1)[0]  # Document IDs are "<table>:<primary key>"
+        if table in index.indexes:
+            index.indexes[table].delete_ref_doc(doc_id, delete_from_docstore=True)
+            index.indexes[table].docstore.delete_document_hash(doc_id)
+            touched.add(table)
+    for chunk in iter_chunks(scan.changed):
+        touched |= add_documents(index, chunk, persist_path)
+
+    for table in touched - set(scan.samples):
+        # Every row of this table is gone
+        index.indexes.pop(table).docstore.close()
+        index.profiles.pop(table, None)
+        shutil.rmtree(table_persist_dir(persist_path, table), ignore_errors=True)
+    touched &= set(scan.samples)
+    for table in touched:
+        index.refresh_profile(table, scan.samples[table])
+
+    index.persist(persist_path, tables=touched)
+    lexical = LexicalIndexWriter.create(persist_path, rebuild=False)
+    if lexical is not None:
+        lexical.remove(stale_ids)
+        lexical.add(scan.changed)
+        lexical.commit()
+        index.lexical = LexicalIndex.open(persist_path)
+    write_index_meta(Settings.embed_model.model_name, index.profiles, persist_path)
+    answer_cache.invalidate()
+
+    changed_ids = {doc.doc_id for doc in scan.changed}
+    removed = sum(1 for doc_id in stale_ids if doc_id not in changed_ids)
+    updated = len(stale_ids) - removed
+    print(f"Index updated: {len(scan.changed) - updated} added, {updated} updated, {removed} removed "
+          f"across {len(touched)} tables")
+    return index
+
+def index_is_compatible(meta: dict) -> bool:
+    """Whether a persisted index was built with the current format, embedding model, FAISS settings and node size."""
+    return (
+        meta.get("format_version") == INDEX_FORMAT_VERSION
+        and meta.get("model_name") == EMBED_MODEL_NAME
+        and meta.get("vector_store") == faiss_settings()
+        and meta.get("node_max_chars") == NODE_MAX_CHARS
+        and "tables" in meta
+    )
+
+def get_or_build_index(db_path=DB_PATH, persist_path=INDEX_PATH, mode=INDEX_STARTUP_MODE):
+    """Open the persisted index, re-embedding only rows that changed since it was built.
+
+    In "readonly" mode the index is only opened, never scanned against the database or
+    written, so any number of worker processes can share one index built beforehand.
+    """
+    if mode == "readonly":
+        meta = read_index_meta(persist_path)
+        if not index_is_compatible(meta):
+            raise RuntimeError(f"No usable index at {persist_path}; build it first with INDEX_STARTUP_MODE=auto")
+        return load_index(persist_path, meta["tables"], readonly=True)
+
+    if mode != "rebuild":
+        meta = read_index_meta(persist_path)
+        if index_is_compatible(meta):
+            try:
+                # One streaming pass, diffed against the stored row hashes, keeps only the rows that changed
+                index = load_index(persist_path, meta["tables"])
+                scan = RowScan(index).read(iter_sqlite_documents(db_path))
+                if not scan.changed and not scan.stale_ids:
+                    print(f"Index at {persist_path} is up to date.")
+                    return index
+                return update_index(index, scan, persist_path)
+            except Exception as e:
+                print(f"[!] Failed to reuse persisted index, rebuilding: {e}")
+        else:
+            print("Persisted index is missing or was built with different settings.")
+
+    return build_index(db_path, persist_path)
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Dict, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from config import EMBED_MODEL_NAME, EMBED_BATCH_SIZE, QUERY_BATCH_MAX_SIZE, QUERY_BATCH_WAIT_MS, QUERY_EMBED_CACHE_SIZE
+from query_batcher import QueryEmbeddingBatcher
+from query_cache import LRUCache, normalize_query
+
+# How many forward batches are length-sorted together per LlamaIndex embedding call
+EMBED_SORT_WINDOW = 16
+
+
+class E5Embedding(BaseEmbedding):
+    """What every E5 backend shares: length-sorted batching, the query cache and micro-batching.
+
+    A backend only tokenizes (_tokenize) and runs one padded batch through the model (_encode),
+    returning mean-pooled, L2-normalized vectors; one that needs no padding can override
+    _embed_batch and _get_embedding instead.
+    """
+
+    model_name: str = EMBED_MODEL_NAME
+    batch_size: int = EMBED_BATCH_SIZE  # Texts per forward pass
+    _batcher: Optional[QueryEmbeddingBatcher] = None
+    _query_cache: Optional[LRUCache] = None
+
+    def __init__(self, model_name=EMBED_MODEL_NAME, batch_size=EMBED_BATCH_SIZE):
+        # LlamaIndex hands us embed_batch_size texts per call; make that a window of
+        # several forward batches so length sorting has something to work with
+        super().__init__(
+            model_name=model_name,
+            batch_size=batch_size,
+            embed_batch_size=min(batch_size * EMBED_SORT_WINDOW, 2048),
+        )
+        self._query_cache = LRUCache(QUERY_EMBED_CACHE_SIZE)
+
+    def _tokenize(self, texts: List[str]) -> Dict[str, list]:
+        """Unpadded, truncated token ID lists per model input (input_ids, attention_mask, ...)."""
+        raise NotImplementedError
+
+    def _encode(self, features: Dict[str, list]) -> np.ndarray:
+        """Pad one batch of _tokenize output and embed it."""
+        raise NotImplementedError
+
+    def _get_embedding(self, text: str) -> np.ndarray:
+        return self._encode(self._tokenize([text]))[0]
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in forward passes of batch_size, grouping similar lengths to limit padding."""
+        encoded = self._tokenize(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(encoded["input_ids"][i]))
+        embeddings = None
+
+        for start in range(0, len(order), self.batch_size):
+            bucket = order[start:start + self.batch_size]
+            vectors = self._encode({key: [values[i] for i in bucket] for key, values in encoded.items()})
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            embeddings[bucket] = vectors
+        return embeddings
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_batch(texts).tolist()
+
+    def _get_text_embedding(self, text: str) -> np.ndarray:
+        return self._get_embedding(text)
+
+    def enable_query_batching(self, max_batch_size=QUERY_BATCH_MAX_SIZE, max_wait_ms=QUERY_BATCH_WAIT_MS):
+        """Route query embeddings through a shared micro-batcher (for concurrent servers)."""
+        if self._batcher is None:
+            self._batcher = QueryEmbeddingBatcher(self._embed_batch, max_batch_size, max_wait_ms)
+        return self._batcher
+
+    @property
+    def query_cache(self) -> LRUCache:
+        return self._query_cache
+
+    # Queries are embedded in normalized form so every cache hit matches a fresh pass
+    def _get_query_embedding(self, query: str) -> np.ndarray:
+        key = normalize_query(query)
+        embedding = self._query_cache.get(key)
+        if embedding is None:
+            embedding = self._batcher.embed(key) if self._batcher is not None else self._get_embedding(key)
+            self._query_cache.put(key, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> np.ndarray:
+        key = normalize_query(query)
+        embedding = self._query_cache.get(key)
+        if embedding is None:
+            if self._batcher is not None:
+                embedding = await asyncio.wrap_future(self._batcher.submit(key))
+            else:
+                embedding = self._get_embedding(key)
+            self._query_cache.put(key, embedding)
+        return embedding
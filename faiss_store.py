@@ -0,0 +1,264 @@
+import json
+import os
+from typing import Any, List
+import faiss
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.simple import DEFAULT_VECTOR_STORE, NAMESPACE_SEP
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQuery, VectorStoreQueryResult
+from config import (
+    FAISS_INDEX_TYPE, FAISS_STORAGE, FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION, FAISS_HNSW_EF_SEARCH,
+    FAISS_IVF_NLIST, FAISS_IVF_NPROBE, FAISS_PQ_M, FAISS_PQ_NBITS, FAISS_TRAIN_MIN, FAISS_MMAP,
+)
+
+SCALAR_QUANTIZERS = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+# Rebuild an HNSW graph once this share of its vectors are deleted (HNSW can't remove in place)
+HNSW_MAX_TOMBSTONE_RATIO = 0.2
+
+
+def faiss_settings() -> dict:
+    """The configured index layout; an index persisted with different settings is rebuilt."""
+    settings = {"index_type": FAISS_INDEX_TYPE, "storage": FAISS_STORAGE}
+    if FAISS_INDEX_TYPE == "hnsw":
+        settings.update(m=FAISS_HNSW_M, ef_construction=FAISS_HNSW_EF_CONSTRUCTION)
+    elif FAISS_INDEX_TYPE == "ivfpq":
+        settings.update(nlist=FAISS_IVF_NLIST, pq_m=FAISS_PQ_M, pq_nbits=FAISS_PQ_NBITS)
+        settings.pop("storage")  # PQ codes are the storage format
+    return settings
+
+
+def needs_training(settings: dict) -> bool:
+    return settings["index_type"] == "ivfpq" or settings.get("storage") == "int8"
+
+
+def training_size(settings: dict) -> int:
+    """Vectors to collect before training; k-means needs at least one per IVF list / PQ centroid."""
+    if settings["index_type"] == "ivfpq":
+        return max(FAISS_TRAIN_MIN, settings["nlist"], 2 ** settings["pq_nbits"])
+    return FAISS_TRAIN_MIN
+
+
+def new_faiss_index(dim: int, settings: dict):
+    """Empty index with int64 IDs, scoring by inner product (= cosine on the normalized E5 vectors)."""
+    metric = faiss.METRIC_INNER_PRODUCT
+    index_type, storage = settings["index_type"], settings.get("storage", "fp32")
+    if index_type == "ivfpq":
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, settings["nlist"], settings["pq_m"], settings["pq_nbits"], metric)
+        index.own_fields = True
+        quantizer.this.disown()
+        # IVF indexes take IDs natively; a hashtable direct map allows reconstruct() and remove_ids()
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+
+    if index_type == "hnsw":
+        if storage == "fp32":
+            inner = faiss.IndexHNSWFlat(dim, settings["m"], metric)
+        else:
+            inner = faiss.IndexHNSWSQ(dim, SCALAR_QUANTIZERS[storage], settings["m"], metric)
+        inner.hnsw.efConstruction = settings["ef_construction"]
+    elif storage == "fp32":
+        inner = faiss.IndexFlatIP(dim)
+    else:
+        inner = faiss.IndexScalarQuantizer(dim, SCALAR_QUANTIZERS[storage], metric)
+    index = faiss.IndexIDMap2(inner)
+    index.own_fields = True
+    inner.this.disown()
+    return index
+
+
+def _is_hnsw(index) -> bool:
+    return isinstance(index, faiss.IndexIDMap2) and isinstance(faiss.downcast_index(index.index), faiss.IndexHNSW)
+
+
+class FaissStore(BasePydanticVectorStore):
+    """Vector store over one FAISS index, keeping its nodes in the index's storage.db.
+
+    Each vector's FAISS ID is the vector_id of its node row (see CompactDocumentStore), so
+    a search hit, a node's vector and a source row's vectors are all looked up in SQLite;
+    no ID maps are held in memory. Index types that need training (IVF-PQ, int8 storage)
+    start out as an exact fp32 index and switch to the configured one once
+    FAISS_TRAIN_MIN vectors are in, trained on them.
+    """
+
+    stores_text: bool = True  # Query results carry their nodes, so LlamaIndex keeps no node map
+    settings: dict
+
+    _nodes: Any = PrivateAttr(default=None)  # CompactDocumentStore holding the node rows
+    _index: Any = PrivateAttr(default=None)
+    _staging: bool = PrivateAttr(default=False)  # Exact index standing in until there is enough to train on
+    _count: int = PrivateAttr(default=0)  # Live vectors; ntotal - _count are HNSW tombstones
+    _next_id: int = PrivateAttr(default=0)
+    _vector_sum: Any = PrivateAttr(default=None)
+    _mmap_path: Any = PrivateAttr(default=None)  # Set while the index is a read-only memory map
+
+    def __init__(self, nodes, settings=None, **kwargs):
+        super().__init__(settings=settings if settings is not None else faiss_settings(), **kwargs)
+        self._nodes = nodes
+
+    @property
+    def client(self) -> Any:
+        return self._index
+
+    def _create(self, dim: int):
+        self._staging = needs_training(self.settings)
+        self._index = new_faiss_index(dim, {"index_type": "flat"} if self._staging else self.settings)
+        self._vector_sum = np.zeros(dim, dtype=np.float64)
+        self._apply_search_params()
+
+    def _apply_search_params(self):
+        if _is_hnsw(self._index):
+            faiss.downcast_index(self._index.index).hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+        elif isinstance(self._index, faiss.IndexIVF):
+            self._index.nprobe = FAISS_IVF_NPROBE
+
+    def _ensure_writable(self):
+        # A memory-mapped index is read-only; load a private copy before changing it
+        if self._mmap_path is not None:
+            self._index = faiss.read_index(self._mmap_path)
+            self._mmap_path = None
+            self._apply_search_params()
+
+    def _rebuild(self, settings: dict):
+        """Re-create the index from the live vectors, e.g. to train it or drop HNSW tombstones."""
+        ids = np.array(self._nodes.all_vector_ids(), dtype=np.int64)
+        vectors = self._index.reconstruct_batch(ids) if len(ids) else np.zeros((0, self._index.d), dtype=np.float32)
+        index = new_faiss_index(self._index.d, settings)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add_with_ids(vectors, ids)
+        self._index = index
+        self._apply_search_params()
+
+    def add(self, nodes, **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = np.array([node.get_embedding() for node in nodes], dtype=np.float32)
+        if self._index is None:
+            self._create(vectors.shape[1])
+        self._ensure_writable()
+
+        self._remove(self._nodes.get_vector_ids([node.node_id for node in nodes]))
+        ids = np.arange(self._next_id, self._next_id + len(nodes), dtype=np.int64)
+        self._next_id += len(nodes)
+        self._index.add_with_ids(vectors, ids)
+        self._vector_sum += vectors.sum(axis=0, dtype=np.float64)
+        self._nodes.add_vector_nodes(nodes, ids.tolist())
+        self._count += len(nodes)
+
+        if self._staging and self._count >= training_size(self.settings):
+            self._rebuild(self.settings)
+            self._staging = False
+        return [node.node_id for node in nodes]
+
+    def _remove(self, faiss_ids):
+        if not faiss_ids:
+            return
+        ids = np.array(faiss_ids, dtype=np.int64)
+        # Approximate for quantized storage; the sum only feeds the routing centroid
+        self._vector_sum -= self._index.reconstruct_batch(ids).sum(axis=0, dtype=np.float64)
+        if not _is_hnsw(self._index):
+            self._index.remove_ids(ids)
+        # An HNSW vector stays in the graph as a tombstone: with its node row gone, query() skips it
+        self._nodes.delete_vector_nodes(faiss_ids)
+        self._count -= len(faiss_ids)
+
+        if self._index.ntotal - self._count > HNSW_MAX_TOMBSTONE_RATIO * self._index.ntotal:
+            self._rebuild(self.settings)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        faiss_ids = self._nodes.get_ref_doc_vector_ids(ref_doc_id)
+        if faiss_ids:
+            self._ensure_writable()
+            self._remove(faiss_ids)
+
+    def get(self, text_id: str):
+        """The stored vector of a node (decoded, so approximate for fp16/int8/PQ storage)."""
+        faiss_ids = self._nodes.get_vector_ids([text_id])
+        return self._index.reconstruct(faiss_ids[0]).tolist() if faiss_ids else None
+
+    def mean_vector(self) -> np.ndarray:
+        if not self._count:
+            return np.zeros(0, dtype=np.float32)
+        return (self._vector_sum / self._count).astype(np.float32)
+
+    def count(self) -> int:
+        return self._count
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("Metadata filters not implemented for FaissStore.")
+        if self._index is None or not self._count:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        top_k = query.similarity_top_k
+        vector = np.array(query.query_embedding, dtype=np.float32)[np.newaxis, :]
+        # HNSW tombstones have no node: over-fetch 2x, doubling while deletes leave the result short
+        k = min(top_k * 2 if self._index.ntotal > self._count else top_k, self._index.ntotal)
+        found = {}  # vector ID -> node, or None for a tombstone
+        while True:
+            scores, faiss_ids = self._index.search(vector, k)
+            hits = [(score, faiss_id) for score, faiss_id in zip(scores[0].tolist(), faiss_ids[0].tolist()) if faiss_id >= 0]
+            new_ids = [faiss_id for _, faiss_id in hits if faiss_id not in found]
+            resolved = self._nodes.get_vector_nodes(new_ids)
+            found.update((faiss_id, resolved.get(faiss_id)) for faiss_id in new_ids)
+
+            nodes, similarities = [], []
+            for score, faiss_id in hits:
+                if found[faiss_id] is not None:
+                    nodes.append(found[faiss_id])
+                    similarities.append(score)
+                    if len(nodes) == top_k:
+                        break
+            if len(nodes) == top_k or len(hits) < k or k >= self._index.ntotal:
+                break  # Enough nodes, or the index has no more vectors to return
+            k = min(k * 2, self._index.ntotal)
+        return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=[node.node_id for node in nodes])
+
+    def persist(self, persist_path: str, fs=None) -> None:
+        base = os.path.splitext(persist_path)[0]
+        os.makedirs(os.path.dirname(base) or ".", exist_ok=True)
+        state = {
+            "settings": self.settings,
+            "staging": self._staging,
+            "next_id": self._next_id,
+            "vector_sum": self._vector_sum.tolist() if self._vector_sum is not None else None,
+        }
+        # Write-then-rename, so a process reading (or mapping) the old files is not disturbed
+        if self._index is not None:
+            faiss.write_index(self._index, base + ".faiss.tmp")
+            os.replace(base + ".faiss.tmp", base + ".faiss")
+        with open(base + ".state.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(base + ".state.json.tmp", base + ".state.json")
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, nodes, namespace=DEFAULT_VECTOR_STORE, mmap=FAISS_MMAP) -> "FaissStore":
+        base = os.path.join(persist_dir, f"{namespace}{NAMESPACE_SEP}vector_store")
+        with open(base + ".state.json", "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+        store = cls(nodes, settings=state["settings"])
+        if os.path.exists(base + ".faiss"):
+            store._index = None
+            if mmap:
+                # IO_FLAG_MMAP alone only maps IVF lists; MMAP_IFC (FAISS 1.11+) maps the
+                # vectors and graph of flat, SQ and HNSW indexes too
+                if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+                    try:
+                        store._index = faiss.read_index(base + ".faiss", faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+                        store._mmap_path = base + ".faiss"
+                    except RuntimeError as e:
+                        print(f"[!] Could not memory-map {base}.faiss, reading it into RAM: {e}")
+                else:
+                    print(f"[!] FAISS {faiss.__version__} can't memory-map this index (needs 1.11+), reading it into RAM")
+            if store._index is None:
+                store._index = faiss.read_index(base + ".faiss")
+            store._apply_search_params()
+
+        store._staging = state["staging"]
+        store._next_id = state["next_id"]
+        store._count = nodes.node_count()
+        if state["vector_sum"] is not None:
+            store._vector_sum = np.array(state["vector_sum"], dtype=np.float64)
+        return store
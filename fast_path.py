@@ -0,0 +1,232 @@
+import logging
+import re
+import sqlite3
+import threading
+from config import DB_PATH, FAST_PATH_ENABLED, FAST_PATH_MAX_WORDS
+from query_cache import normalize_query
+
+logger = logging.getLogger()
+
+# Entity tables the fast path answers from: the name column, and per field the
+# phrases that ask for it plus the answer template
+ENTITY_TABLES = {
+    "plant_diseases": {
+        "name_column": "disease_name",
+        "fields": {
+            "symptoms": (["symptom", "symptoms", "signs", "look like", "identify"], "Symptoms of {name}: {value}."),
+            "causes": (["cause", "causes", "caused", "reason"], "Causes of {name}: {value}."),
+            "treatment": (["treat", "treatment", "treatments", "cure", "control", "remedy", "get rid", "manage"],
+                          "Treatment for {name}: {value}."),
+            "prevention": (["prevent", "prevention", "avoid"], "To prevent {name}: {value}."),
+            "crop_affected": (["which crops", "what crops", "crops affected", "affect", "affects"],
+                              "Crops affected by {name}: {value}."),
+            "severity": (["severity", "severe", "serious", "dangerous"], "Severity of {name}: {value}."),
+        },
+    },
+    "pests": {
+        "name_column": "pest_name",
+        "fields": {
+            "damage_description": (["damage", "harm", "symptoms"], "Damage caused by {name}: {value}."),
+            "control_methods": (["control", "treat", "treatment", "get rid", "kill", "manage"],
+                                "To control {name}: {value}."),
+            "natural_predators": (["predator", "predators", "natural predators", "natural enemies", "enemies"],
+                                  "Natural predators of {name}: {value}."),
+            "season_active": (["season", "active", "when are", "when do"], "{name} are active: {value}."),
+            "crop_affected": (["which crops", "what crops", "crops affected", "attack", "attacks", "affect"],
+                              "Crops affected by {name}: {value}."),
+        },
+    },
+    "crops": {
+        "name_column": "name",
+        "fields": {
+            "season": (["season", "when to sow", "when to plant", "sowing time"], "{name} is a {value} season crop."),
+            "growth_period_days": (["growth period", "how long", "how many days", "duration", "mature"],
+                                   "{name} takes about {value} days to grow."),
+            "water_requirements": (["water", "water requirement", "water requirements", "irrigation", "irrigate"], "Water requirement of {name}: {value}."),
+            "soil_type": (["soil"], "Suitable soil for {name}: {value}."),
+        },
+    },
+    "farming_equipment": {
+        "name_column": "name",
+        "fields": {
+            "price_range": (["price", "cost", "how much"], "Price range of a {name}: {value}."),
+            "usage": (["used", "uses", "use of", "usage", "purpose"], "A {name} is used for: {value}."),
+            "maintenance_frequency": (["maintenance", "maintain", "service", "servicing"],
+                                      "Maintenance schedule for a {name}: {value}."),
+            "power_source": (["power", "powered", "fuel", "run on"], "Power source of a {name}: {value}."),
+            "location_hint": (["where is", "where are", "where can i find", "where do i find", "location", "kept",
+                               "stored"], "Where to find the {name}: {value}."),
+        },
+    },
+}
+
+# Words a question may contain besides the entity and the field phrase. Any other word
+# ("buy", "windy", "wet soil") asks something the template can't answer.
+FILLER_WORDS = frozenset("""
+    a an the of for to in on at by with about and or is are was were be been does do did can could should
+    would will what which who how tell me my i we you your our please give show know explain list describe
+    it its they their them this that these those there any some much many take takes grow grown
+""".split())
+
+
+def _padded_words(text: str) -> str:
+    """Question words separated by single spaces, padded so phrases can be matched as " phrase "."""
+    return " " + " ".join(re.findall(r"\w+", normalize_query(text))) + " "
+
+
+def _name_forms(name: str) -> set:
+    """The name as written plus a crude singular/plural variant ("Aphids" ~ "aphid")."""
+    key = _padded_words(name).strip()
+    return {key, key[:-1]} if key.endswith("s") else {key, key + "s"}
+
+
+def ensure_name_indexes(db_path=DB_PATH):
+    """Index the name column of every entity table so lookups don't scan the table."""
+    conn = sqlite3.connect(db_path)
+    try:
+        for table, spec in ENTITY_TABLES.items():
+            column = spec["name_column"]
+            try:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column} COLLATE NOCASE)")
+            except sqlite3.Error as e:
+                print(f"[!] Could not index {table}.{column} for the fast path: {e}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class FastPath:
+    """Answers "<field> of <entity>" questions straight from SQLite, without retrieval or the LLM.
+
+    Fires only when the question names exactly one known entity (from ENTITY_TABLES), asks
+    for exactly one of its fields and says nothing else but FILLER_WORDS; everything else
+    goes down the normal RAG path.
+    """
+
+    def __init__(self, db_path=DB_PATH, enabled=FAST_PATH_ENABLED, max_words=FAST_PATH_MAX_WORDS):
+        self.db_path = db_path
+        self.enabled = enabled
+        self.max_words = max_words
+        self._conn = None
+        self._names = None  # name form -> (table, name as stored)
+        self._max_name_words = 0
+        self._lock = threading.Lock()
+        self.questions = 0
+        self.answered = 0
+        self.by_field = {}
+
+    def load(self):
+        """Index the name columns and read the entity names. Called at startup, or lazily on first use."""
+        with self._lock:
+            if self._names is not None:
+                return
+            names, ambiguous = {}, set()
+            try:
+                ensure_name_indexes(self.db_path)
+                self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+                for table, spec in ENTITY_TABLES.items():
+                    rows = self._conn.execute(f"SELECT DISTINCT {spec['name_column']} FROM {table}").fetchall()
+                    for (name,) in rows:
+                        if not name or len(str(name)) < 3:
+                            continue
+                        for form in _name_forms(str(name)):
+                            if names.get(form, (table, name)) != (table, name):
+                                ambiguous.add(form)
+                            names[form] = (table, name)
+            except sqlite3.Error as e:
+                print(f"[!] Fast path disabled, could not read entity names: {e}")
+                names = {}
+            # A name shared by two entities (or two tables) can't identify either
+            for form in ambiguous:
+                names.pop(form)
+            self._names = names
+            self._max_name_words = max((form.count(" ") + 1 for form in names), default=0)
+            logger.info(f"Fast path loaded {len(names)} entity name forms")
+
+    def match(self, question: str):
+        """(table, name, field) if the question targets exactly one entity and one of its fields, else None."""
+        padded = _padded_words(question)
+        words = padded.split()
+        if not words or len(words) > self.max_words:
+            return None
+
+        found = {}  # (table, name) -> longest matched form
+        for size in range(1, self._max_name_words + 1):
+            for start in range(len(words) - size + 1):
+                form = " ".join(words[start:start + size])
+                entity = self._names.get(form)
+                if entity is not None and len(form) > len(found.get(entity, "")):
+                    found[entity] = form
+        # "Mildew" inside "Powdery Mildew" is the same mention, not a second entity
+        found = {
+            entity: form for entity, form in found.items()
+            if not any(other != form and f" {form} " in f" {other} " for other in found.values())
+        }
+
+        candidates = []
+        for (table, name), form in found.items():
+            rest = padded.replace(f" {form} ", " ")
+            fields = {}  # field -> its phrases found in the question
+            for field, (phrases, _) in ENTITY_TABLES[table]["fields"].items():
+                matched = [phrase for phrase in phrases if f" {phrase} " in rest]
+                if matched:
+                    fields[field] = matched
+            if len(fields) != 1:
+                continue
+            field, phrases = next(iter(fields.items()))
+            for phrase in sorted(phrases, key=len, reverse=True):
+                rest = rest.replace(f" {phrase} ", " ")
+            if set(rest.split()) <= FILLER_WORDS:
+                candidates.append((table, name, field))
+        return candidates[0] if len(candidates) == 1 else None
+
+    def lookup(self, table: str, name: str, field: str):
+        column = ENTITY_TABLES[table]["name_column"]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT {field} FROM {table} WHERE {column} = ? COLLATE NOCASE", (name,)
+            ).fetchall()
+        values = [value for (value,) in rows if value not in (None, "")]
+        # Rows of the same entity that disagree need the LLM to reconcile them
+        return values[0] if len(values) == 1 else None
+
+    def answer(self, question: str):
+        """Template answer for the question, or None to fall through to retrieval + generation."""
+        if not self.enabled:
+            return None
+        if self._names is None:
+            self.load()
+
+        answer, target = None, self.match(question)
+        if target is not None:
+            table, name, field = target
+            try:
+                value = self.lookup(table, name, field)
+            except sqlite3.Error as e:
+                logger.warning(f"Fast path lookup failed for {table}.{field}: {e}")
+                value = None
+            if value is not None:
+                template = ENTITY_TABLES[table]["fields"][field][1]
+                answer = template.format(name=name, value=str(value).strip().rstrip("."))
+
+        with self._lock:
+            self.questions += 1
+            if answer is not None:
+                self.answered += 1
+                key = f"{table}.{field}"
+                self.by_field[key] = self.by_field.get(key, 0) + 1
+        if answer is not None:
+            logger.info(f"[⚡] Answered from the structured fast path ({table}.{field}: {name})")
+        return answer
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "questions": self.questions,
+                "answered": self.answered,
+                "hit_rate": round(self.answered / self.questions, 3) if self.questions else 0.0,
+                "by_field": dict(self.by_field),
+            }
+
+
+fast_path = FastPath()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+E5 embeddings through llama.cpp, from a GGUF conversion of the model.
+
+llama_cpp is already loaded for MistralEngine, so with EMBED_BACKEND=gguf the serving
+process embeds queries without importing torch or transformers at all. Convert the
+model with llama.cpp's converter, e.g.
+
+    python convert_hf_to_gguf.py path/to/e5-small-v2 --outtype f16 --outfile models/e5-small-v2-f16.gguf
+
+then check it against the PyTorch embeddings with
+
+    python gguf_embedding.py
+"""
+
+import argparse
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from config import EMBED_MODEL_NAME, EMBED_BATCH_SIZE, GGUF_EMBED_MODEL_PATH, ONNX_PARITY_MIN_COSINE
+from embedding_base import E5Embedding
+
+MAX_TOKENS = 512  # E5's position limit; also the tokens llama.cpp evaluates per batch
+
+
+class GgufE5Embedding(E5Embedding):
+    """E5 run by llama.cpp in embedding mode, mean-pooled and normalized like the PyTorch model.
+
+    llama.cpp packs sequences of different lengths into one batch without padding, so
+    this backend embeds whole lists directly instead of in length-sorted padded batches.
+    """
+
+    _llm: Optional[object] = None
+    _lock: Optional[object] = None
+
+    def __init__(self, model_name=EMBED_MODEL_NAME, batch_size=EMBED_BATCH_SIZE, threads=None,
+                 model_path=GGUF_EMBED_MODEL_PATH):
+        from llama_cpp import Llama, LLAMA_POOLING_TYPE_MEAN
+
+        super().__init__(model_name=model_name, batch_size=batch_size)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"GGUF embedding model missing: {model_path} (see gguf_embedding.py to convert it)")
+        print(f"Loading embedding model: {model_path} on llama.cpp")
+        self._llm = Llama(
+            model_path=model_path,
+            embedding=True,
+            n_ctx=MAX_TOKENS,
+            n_batch=MAX_TOKENS,
+            n_ubatch=MAX_TOKENS,  # Encoder models need the whole batch in one micro-batch
+            pooling_type=LLAMA_POOLING_TYPE_MEAN,
+            n_threads=threads,
+            verbose=False,
+        )
+        self._lock = threading.Lock()  # One llama.cpp context, not safe to share between threads
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        # Longer texts are cut at MAX_TOKENS, as transformers truncates them
+        with self._lock:
+            vectors = self._llm.embed(texts, normalize=True, truncate=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _get_embedding(self, text: str) -> np.ndarray:
+        return self._embed_batch([text])[0]
+
+
+def main():
+    from onnx_embedding import parity_texts, query_latency_ms
+    from embed_and_index import E5SmallV2Embedding
+
+    parser = argparse.ArgumentParser(description="Check a GGUF conversion of the E5 model against PyTorch.")
+    parser.add_argument("--model", default=EMBED_MODEL_NAME, help="Hugging Face model the GGUF was converted from")
+    parser.add_argument("--gguf", default=GGUF_EMBED_MODEL_PATH, help="GGUF file to check")
+    parser.add_argument("--samples", type=int, default=200, help="database rows in the parity check")
+    parser.add_argument("--min-cosine", type=float, default=ONNX_PARITY_MIN_COSINE,
+                        help="lowest acceptable cosine similarity to PyTorch")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.gguf):
+        print(f"❌ GGUF model missing: {args.gguf}")
+        return
+
+    texts = parity_texts(samples=args.samples)
+    print(f"Checking parity on {len(texts)} texts")
+    reference = E5SmallV2Embedding(args.model)
+    embed_model = GgufE5Embedding(args.model, model_path=args.gguf)
+    # Both sides are unit vectors, so the row-wise dot product is the cosine
+    cosine = float(np.min(np.sum(reference._embed_batch(texts) * embed_model._embed_batch(texts), axis=1)))
+
+    print(f"{'model':>16} {'min cosine':>11} {'ms/query':>9}")
+    print(f"{'torch':>16} {1.0:>11.4f} {query_latency_ms(reference):>9.2f}")
+    print(f"{'gguf':>16} {cosine:>11.4f} {query_latency_ms(embed_model):>9.2f}")
+    if cosine < args.min_cosine:
+        print(f"❌ Below {args.min_cosine} cosine. Don't serve {args.gguf} with EMBED_BACKEND=gguf.")
+        raise SystemExit(1)
+    print("✅ Parity OK. Serve with EMBED_BACKEND=gguf.")
+
+
+if __name__ == "__main__":
+    main()
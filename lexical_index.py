@@ -0,0 +1,133 @@
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from fast_path import FILLER_WORDS
+from query_cache import normalize_query
+
+LEXICAL_DB_FILE = "lexical.db"
+
+
+def _words(text: str) -> str:
+    return " ".join(re.findall(r"\w+", normalize_query(text)))
+
+
+def record_title(doc) -> str:
+    """The record's name/title field (e.g. "Late blight"), used for exact-match lookups."""
+    for line in doc.text.splitlines()[1:]:
+        label, _, value = line.partition(": ")
+        label = label.lower()
+        if " (from " not in label and (label.endswith("name") or label.endswith("title")):
+            return value.strip()
+    return ""
+
+
+class LexicalIndexWriter:
+    """Writes lexical.db in chunks to a temporary copy, swapped in atomically on commit()."""
+
+    def __init__(self, persist_path, rebuild=True):
+        self.path = os.path.join(persist_path, LEXICAL_DB_FILE)
+        self.tmp_path = self.path + ".tmp"
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        if not rebuild:
+            shutil.copyfile(self.path, self.tmp_path)
+
+        self.conn = sqlite3.connect(self.tmp_path)
+        if rebuild:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE rows_fts USING fts5("
+                "doc_id UNINDEXED, source_table UNINDEXED, title, body, record_hash UNINDEXED, "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    @classmethod
+    def create(cls, persist_path, rebuild=True):
+        """A writer, or None when SQLite lacks FTS5 or there is no lexical index to update."""
+        if not rebuild and not os.path.exists(os.path.join(persist_path, LEXICAL_DB_FILE)):
+            return None
+        try:
+            return cls(persist_path, rebuild)
+        except (OSError, sqlite3.Error) as e:
+            print(f"[!] Could not build the FTS5 lexical index, using vector search only: {e}")
+            return None
+
+    def add(self, documents):
+        self.conn.executemany(
+            "INSERT INTO rows_fts (doc_id, source_table, title, body, record_hash) VALUES (?, ?, ?, ?, ?)",
+            (
+                (doc.doc_id, doc.metadata["table"], record_title(doc), doc.text, doc.metadata["record_hash"])
+                for doc in documents
+            ),
+        )
+
+    def remove(self, doc_ids):
+        # doc_id is not indexed, so delete them all in one pass over the table
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS removed (doc_id TEXT PRIMARY KEY)")
+        self.conn.executemany("INSERT OR IGNORE INTO removed VALUES (?)", ((doc_id,) for doc_id in doc_ids))
+        self.conn.execute("DELETE FROM rows_fts WHERE doc_id IN (SELECT doc_id FROM removed)")
+        self.conn.execute("DELETE FROM removed")
+
+    def commit(self):
+        self.conn.commit()
+        self.conn.close()
+        # Swap in atomically so processes reading the old file are not disturbed
+        os.replace(self.tmp_path, self.path)
+
+
+class LexicalIndex:
+    """BM25 search over record titles and text via SQLite FTS5."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, persist_path):
+        path = os.path.join(persist_path, LEXICAL_DB_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except sqlite3.Error as e:
+            print(f"[!] Lexical index unavailable: {e}")
+            return None
+
+    def search(self, query: str, top_k: int):
+        """Return [(doc_id, title, bm25 score, record hash)] best first; titles weigh 5x the body text."""
+        terms = [term for term in re.findall(r"\w+", normalize_query(query)) if len(term) > 1]
+        if not terms:
+            return []
+        expression = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT doc_id, title, bm25(rows_fts, 0.0, 0.0, 5.0, 1.0, 0.0) AS score, record_hash FROM rows_fts "
+                "WHERE rows_fts MATCH ? ORDER BY score LIMIT ?",
+                (expression, top_k),
+            ).fetchall()
+        # FTS5's bm25() is lower-is-better; flip it so higher means more relevant
+        return [(doc_id, title, -score, record_hash) for doc_id, title, score, record_hash in rows]
+
+    @staticmethod
+    def exact_match(query: str, hits):
+        """Doc ID of the record the query is nothing but the title of (e.g. "Late blight?").
+
+        Returns None unless the query names exactly one title, says nothing else but
+        FILLER_WORDS, and exactly one record carries that title. Rows with the same title
+        and the same content apart from their key are copies of one record, and count once.
+        """
+        padded_query = f" {_words(query)} "
+        matches = {}  # title -> {record hash: first doc_id}
+        for doc_id, title, _, record_hash in hits:
+            key = _words(title)
+            if len(key) >= 4 and f" {key} " in padded_query:
+                matches.setdefault(key, {}).setdefault(record_hash, doc_id)
+        # "Mildew" inside "Powdery Mildew" is the same mention, not a second title
+        titles = [key for key in matches if not any(other != key and f" {key} " in f" {other} " for other in matches)]
+        if len(titles) != 1 or len(matches[titles[0]]) != 1:
+            return None
+        rest = padded_query.replace(f" {titles[0]} ", " ").split()
+        if not set(rest) <= FILLER_WORDS:
+            return None  # The question asks something about the record, not just for it
+        return next(iter(matches[titles[0]].values()))
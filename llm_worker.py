@@ -0,0 +1,147 @@
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STREAM_END = object()
+
+
+class QueueFullError(Exception):
+    """Raised when the generation queue is at capacity; callers should retry later."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Generation queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def resolve_pool_shape(pool_size="auto", threads="auto", cpu_count=None):
+    """Turn LLM_POOL_SIZE / LLM_THREADS settings ("auto" or a number) into (instances, threads each)."""
+    cpus = cpu_count or os.cpu_count() or 1
+    if str(threads) == "auto":
+        # With a fixed pool, split the machine between instances; otherwise use 4-thread instances
+        threads = max(1, cpus // int(pool_size)) if str(pool_size) != "auto" else min(4, cpus)
+    threads = int(threads)
+    pool_size = max(1, cpus // threads) if str(pool_size) == "auto" else int(pool_size)
+    return pool_size, threads
+
+
+class GenerationPool:
+    """Runs generations on a fixed set of MistralEngine instances fed from one bounded queue.
+
+    llama.cpp models are not safe to call concurrently, so each engine is owned by its
+    own worker thread and request threads only hand prompts to the pool; whichever
+    engine is free picks up the next job. When `max_queue_size` jobs are already
+    waiting, new submissions fail fast with QueueFullError rather than piling up.
+    """
+
+    def __init__(self, engines, max_queue_size: int = 8):
+        self.engines = list(engines)
+        self.max_queue_size = max_queue_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._rejected = 0
+        self._busy = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._avg_service = 0.0  # Moving average of seconds per generation
+        self._threads = [
+            threading.Thread(target=self._run, args=(engine,), name=f"llm-generation-{i}", daemon=True)
+            for i, engine in enumerate(self.engines)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _submit(self, job) -> Future:
+        future = Future()
+        try:
+            self._queue.put_nowait((job, future, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError(self.retry_after())
+        return future
+
+    def generate(self, prompt: str) -> str:
+        return self._submit(lambda engine: engine.generate(prompt)).result()
+
+    def generate_stream(self, prompt: str):
+        """Queue a streaming generation and return an iterator over its text pieces.
+
+        Submission happens immediately so QueueFullError surfaces before any output.
+        """
+        pieces = queue.Queue()
+        cancelled = threading.Event()
+
+        def job(engine):
+            try:
+                for piece in engine.generate_stream(prompt):
+                    if cancelled.is_set():
+                        break
+                    pieces.put(piece)
+            finally:
+                pieces.put(_STREAM_END)
+
+        future = self._submit(job)
+
+        def drain():
+            try:
+                while True:
+                    piece = pieces.get()
+                    if piece is _STREAM_END:
+                        break
+                    yield piece
+                future.result()  # Re-raise anything the engine threw
+            finally:
+                cancelled.set()  # Client went away: stop decoding for nobody
+
+        return drain()
+
+    def count_tokens(self, text: str) -> int:
+        # Tokenizing only reads the vocabulary, so it is safe outside the worker threads
+        return self.engines[0].count_tokens(text)
+
+    def retry_after(self) -> int:
+        with self._lock:
+            pending = self._queue.qsize() + self._busy
+            return max(1, math.ceil(pending * self._avg_service / len(self.engines)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_size": self.max_queue_size,
+                "instances": len(self.engines),
+                "busy_instances": self._busy,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_seconds": round(self._total_wait / self._completed, 3) if self._completed else 0.0,
+                "max_wait_seconds": round(self._max_wait, 3),
+                "avg_generation_seconds": round(self._avg_service, 3),
+            }
+
+    def _run(self, engine):
+        while True:
+            job, future, enqueued_at = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            started = time.monotonic()
+            with self._lock:
+                self._busy += 1
+            try:
+                future.set_result(job(engine))
+            except Exception as e:
+                future.set_exception(e)
+            finished = time.monotonic()
+
+            with self._lock:
+                self._busy -= 1
+                wait = started - enqueued_at
+                self._completed += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+                service = finished - started
+                self._avg_service = service if self._completed == 1 else 0.8 * self._avg_service + 0.2 * service
@@ -2,12 +2,23 @@ import os
 import sys
 import logging
 import contextlib
+import threading
 import requests
 from llama_index.core.settings import Settings
-from config import MODEL_PATH, DB_PATH, INDEX_PATH
+from llama_index.core.schema import QueryBundle
+from config import (
+    MODEL_PATH, DB_PATH, INDEX_PATH, LLM_THREADS, LLM_N_CTX, LLM_N_BATCH,
+    LLM_USE_MMAP, LLM_USE_MLOCK, LLM_MAX_TOKENS, RETRIEVAL_TOP_K, CONTEXT_SCORE_GAP,
+    CONTEXT_TOKEN_BUDGET,
+)
 from auth.user_auth import init_user_table, signup, login
 from models.Mistral.mistral_engine import MistralEngine
-from embed_and_index import build_index
+from embed_and_index import get_or_build_index
+from retrieval import build_retriever
+from query_cache import answer_cache
+from fast_path import fast_path
+from llm_worker import QueueFullError, resolve_pool_shape
+from context_packer import pack_context, select_top_k
 
 # ========== Logging Setup ==========
 os.makedirs("logs", exist_ok=True)
@@ -20,19 +31,33 @@ logging.basicConfig(
 logger = logging.getLogger()
 
 # ========== Suppress LLM Output ==========
+# sys.stdout/sys.stderr are process-wide, so concurrent requests share one redirect:
+# the first thread in swaps the streams, the last one out restores them.
+_suppress_lock = threading.Lock()
+_suppress_depth = 0
+_saved_streams = None
+
 @contextlib.contextmanager
 def suppress_output(to_logfile=True):
-    if to_logfile:
-        f = open("logs/llama.log", "a")
-    else:
-        f = open(os.devnull, 'w')
-    old_stdout, old_stderr = sys.stdout, sys.stderr
-    sys.stdout, sys.stderr = f, f
+    global _suppress_depth, _saved_streams
+    with _suppress_lock:
+        if _suppress_depth == 0:
+            if to_logfile:
+                f = open("logs/llama.log", "a")
+            else:
+                f = open(os.devnull, 'w')
+            _saved_streams = (sys.stdout, sys.stderr, f)
+            sys.stdout, sys.stderr = f, f
+        _suppress_depth += 1
     try:
         yield
     finally:
-        sys.stdout, sys.stderr = old_stdout, old_stderr
-        f.close()
+        with _suppress_lock:
+            _suppress_depth -= 1
+            if _suppress_depth == 0:
+                old_stdout, old_stderr, f = _saved_streams
+                sys.stdout, sys.stderr = old_stdout, old_stderr
+                f.close()
 
 with suppress_output():
     Settings.llm = None  # Disable OpenAI default
@@ -51,20 +76,45 @@ def notify_api(endpoint: str, data: dict):
         logger.error(f"Could not connect to API server for {endpoint}: {e}")
 
 # ========== Core Logic ==========
-def answer_question(index, question: str, model) -> str:
+NO_INFO_MESSAGE = "Sorry, I don't have that information."
+
+# Fixed start of every prompt; the engine keeps it pre-evaluated in its KV cache
+PROMPT_PREAMBLE = """You are QueryFARMER, a chatbot for farmers.  
+Always answer in **plain English** with short, practical advice.  
+Never output SQL, code, or database queries.  
+Only use the provided factual context.  
+
+"""
+
+def _query_embedder(question: str):
+    """Returns a function embedding the question on first call and reusing that vector after,
+    so the answer cache, retrieval and the cache write share one forward pass."""
+    embedding = None
+
+    def query_embedding():
+        nonlocal embedding
+        if embedding is None:
+            embedding = Settings.embed_model.get_query_embedding(question)
+        return embedding
+    return query_embedding
+
+def build_prompt(retriever, question: str, model, query_embedding=None):
+    """Retrieve context for the question and build the Mistral prompt (None if nothing was found)."""
+    if query_embedding is None:
+        query_embedding = Settings.embed_model.get_query_embedding(question)
+    query_bundle = QueryBundle(question, embedding=query_embedding)
     with suppress_output():
-        query_engine = index.as_query_engine(similarity_top_k=4, similarity_cutoff=0.6)
-        response_obj = query_engine.query(question)
+        source_nodes = retriever.retrieve(query_bundle)
 
     with open("logs/retrieval_debug.log", "a", encoding="utf-8") as f:
         f.write(f"\n--- Query: {question} ---\n")
-        for i, node in enumerate(response_obj.source_nodes):
+        for i, node in enumerate(source_nodes):
             score = f"{node.score:.3f}" if node.score is not None else "N/A"
             f.write(f"[{i+1}] Score: {score}\n")
             f.write(node.node.text[:500].strip() + "\n---\n")
             
     table_counts = {}
-    for node in response_obj.source_nodes:
+    for node in source_nodes:
         table = node.node.metadata.get("table", "unknown")
         table_counts[table] = table_counts.get(table, 0) + 1
 
@@ -72,45 +122,43 @@ def answer_question(index, question: str, model) -> str:
     logger.info(f"[🔍] Most relevant table inferred: {most_relevant_table}")        
 
     filtered_nodes = [
-        node for node in response_obj.source_nodes
+        node for node in source_nodes
         if node.score is not None and node.score >= 0.5
     ]
 
-    if not filtered_nodes and response_obj.source_nodes:
+    if not filtered_nodes and source_nodes:
         print("[⚠️] Fallback: Using top 3 chunks below cutoff")
-        filtered_nodes = response_obj.source_nodes[:3]
+        filtered_nodes = source_nodes[:3]
 
     if not filtered_nodes:
         print("[❌] No chunks retrieved. Returning fallback message.")
-        return "Sorry, I don't have that information."
-
-    context = "\n\n".join(node.node.text for node in filtered_nodes).strip()
+        return None
 
-    prompt = f"""You are QueryFARMER, a chatbot for farmers.  
-Always answer in **plain English** with short, practical advice.  
-Never output SQL, code, or database queries.  
-Only use the provided factual context.  
+    filtered_nodes = select_top_k(filtered_nodes, RETRIEVAL_TOP_K, CONTEXT_SCORE_GAP)
 
-### Student's Question:
+    head = PROMPT_PREAMBLE + f"""### Student's Question:
 {question}
 
 ### Factual Context:
-{context}
-
-### Answer:
 """
+    tail = "\n\n### Answer:\n"
 
-    with suppress_output():
-        try:
-            response = model.generate(prompt).strip()
-        except Exception as e:
-            return f"Error generating response: {e}"
+    # Whatever is left of the window after the prompt frame and the answer goes to context
+    available = LLM_N_CTX - LLM_MAX_TOKENS - model.count_tokens(head + tail)
+    context = pack_context(filtered_nodes, model.count_tokens, min(CONTEXT_TOKEN_BUDGET, available)).strip()
+    if not context:
+        print("[❌] No context fits the token budget. Returning fallback message.")
+        return None
+
+    return head + context + tail
 
+def clean_response(response: str) -> str:
+    """Replace unusable model output with a canned message; good answers pass through unchanged."""
     if not response or response.lower() in ["", "answer:", "context:", "question:"]:
         return "Sorry, I could not generate a response."
 
     if "sorry" in response.lower() and "don't have that" in response.lower():
-        return "Sorry, I don't have that information."
+        return NO_INFO_MESSAGE
     
     # Optional post-filter for SQL-like output
     if "select" in response.lower() or "from" in response.lower():
@@ -118,10 +166,93 @@ Only use the provided factual context.
 
     return response
 
-def safe_llm_init():
+def answer_question(retriever, question: str, model) -> str:
+    direct = fast_path.answer(question)
+    if direct is not None:
+        return direct
+
+    query_embedding = _query_embedder(question)
+    cached = answer_cache.get(question, query_embedding)
+    if cached is not None:
+        logger.info("[⚡] Answer served from cache")
+        return cached
+
+    prompt = build_prompt(retriever, question, model, query_embedding())
+    if prompt is None:
+        return NO_INFO_MESSAGE
+
+    with suppress_output():
+        try:
+            response = model.generate(prompt).strip()
+        except QueueFullError:
+            raise
+        except Exception as e:
+            return f"Error generating response: {e}"
+
+    answer = clean_response(response)
+    if answer == response:
+        answer_cache.put(question, answer, query_embedding())
+    return answer
+
+def stream_answer(retriever, question: str, model):
+    """Like answer_question, but yields ("token", text) while Mistral decodes and
+    finishes with ("answer", final_text) once the output filters have run."""
+    direct = fast_path.answer(question)
+    if direct is not None:
+        yield "answer", direct
+        return
+
+    query_embedding = _query_embedder(question)
+    cached = answer_cache.get(question, query_embedding)
+    if cached is not None:
+        logger.info("[⚡] Answer served from cache")
+        yield "answer", cached
+        return
+
+    prompt = build_prompt(retriever, question, model, query_embedding())
+    if prompt is None:
+        yield "answer", NO_INFO_MESSAGE
+        return
+
+    pieces = []
+    try:
+        with suppress_output():
+            tokens = model.generate_stream(prompt)
+        while True:
+            # Keep llama.cpp chatter out of the console without swallowing our own output
+            with suppress_output():
+                piece = next(tokens, None)
+            if piece is None:
+                break
+            pieces.append(piece)
+            yield "token", piece
+    except QueueFullError:
+        raise
+    except Exception as e:
+        yield "answer", f"Error generating response: {e}"
+        return
+
+    response = "".join(pieces).strip()
+    answer = clean_response(response)
+    if answer == response:
+        answer_cache.put(question, answer, query_embedding())
+    yield "answer", answer
+
+def safe_llm_init(n_threads=None):
+    if n_threads is None:
+        _, n_threads = resolve_pool_shape(1, LLM_THREADS)
     with suppress_output():
-        model = MistralEngine(model_path=MODEL_PATH)
-    logger.info("MistralEngine initialized.")
+        model = MistralEngine(
+            model_path=MODEL_PATH,
+            n_threads=n_threads,
+            n_ctx=LLM_N_CTX,
+            n_batch=LLM_N_BATCH,
+            use_mmap=LLM_USE_MMAP,
+            use_mlock=LLM_USE_MLOCK,
+            max_tokens=LLM_MAX_TOKENS,
+        )
+        model.cache_prefix(PROMPT_PREAMBLE)
+    logger.info(f"MistralEngine initialized with {n_threads} threads.")
     return model
 
 # ========== Main CLI ==========
@@ -170,9 +301,10 @@ def main():
     print("⏳ Loading model...")
     model = safe_llm_init()
 
-    logger.info("Building RAG index...")
+    logger.info("Loading RAG index...")
     with suppress_output():
-        index = build_index(db_path=DB_PATH, persist_path=INDEX_PATH)
+        index = get_or_build_index(db_path=DB_PATH, persist_path=INDEX_PATH)
+        retriever = build_retriever(index)
 
     print("\nYou can start chatting! (type 'exit' to quit)\n")
 
@@ -186,8 +318,21 @@ def main():
         print("Bot: ", end="", flush=True)
 
         try:
-            response = answer_question(index, user_query, model)
-            print(response)
+            response, streamed = "", ""
+            for kind, text in stream_answer(retriever, user_query, model):
+                if kind == "token":
+                    print(text if streamed else text.lstrip(), end="", flush=True)
+                    streamed += text
+                else:
+                    response = text
+
+            if not streamed:
+                print(response)
+            elif response != streamed.strip():
+                # Output filters rejected what was streamed; show the replacement
+                print(f"\n{response}")
+            else:
+                print()
             logger.info(f"Bot response: {response}")
             notify_api("/ask", {"question": user_query})
         except Exception as e:
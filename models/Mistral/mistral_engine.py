@@ -2,20 +2,42 @@ from llama_cpp import Llama
 import os
 
 class MistralEngine:
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, n_threads: int = 4, n_ctx: int = 2048, n_batch: int = 512,
+                 use_mmap: bool = True, use_mlock: bool = False, max_tokens: int = 512):
+        self.max_tokens = max_tokens
         self.llm = Llama(
             model_path=model_path,
-            n_ctx=2048,           # Reduced context
-            n_threads=4,          # Fixed to 4 threads
-            n_batch=8,            # Add batch size if possible
+            n_ctx=n_ctx,
+            n_threads=n_threads,  # Per-instance thread budget when pooled
+            n_batch=n_batch,      # Prompt tokens per eval call; small values make prompt eval crawl
+            use_mmap=use_mmap,    # Pooled instances share the weights via the page cache
+            use_mlock=use_mlock,
             temperature=0.2,
             top_p=0.9,
             stop=["</s>"]
         )
 
+    def cache_prefix(self, prefix: str):
+        """Evaluate a fixed prompt prefix once, at startup, so it is already in the KV cache.
+
+        llama-cpp-python keeps the longest token prefix a prompt shares with what was
+        evaluated before, so every prompt starting with this one (including the first)
+        only has to evaluate what comes after it.
+        """
+        self.llm.reset()
+        self.llm.eval(self.llm.tokenize(prefix.encode("utf-8")))
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
     def generate(self, prompt: str) -> str:
         output = self.llm(
             prompt,
-            max_tokens=512,
+            max_tokens=self.max_tokens,
         )
         return output['choices'][0]['text'].strip()
+
+    def generate_stream(self, prompt: str):
+        """Yield text pieces as llama.cpp decodes them."""
+        for chunk in self.llm(prompt, max_tokens=self.max_tokens, stream=True):
+            yield chunk['choices'][0]['text']
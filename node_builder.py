@@ -0,0 +1,92 @@
+import re
+from llama_index.core.schema import NodeRelationship, TextNode
+from config import NODE_MAX_CHARS
+from lexical_index import record_title
+
+# Where an oversized field value may be cut: after a sentence or clause
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+")
+
+
+def _split_value(label: str, value: str, max_chars: int, first_chars=None) -> list:
+    """Cut one oversized "Label: value" field (or unlabeled text, label "") into lines that each fit in max_chars.
+
+    When first_chars is given (no more than max_chars), the first line fits in it instead.
+    """
+    overhead = len(label) + 2 if label else 0
+    pieces, current = [], ""
+
+    def room():
+        limit = first_chars if first_chars is not None and not pieces else max_chars
+        return max(limit - overhead, 1)
+
+    for sentence in _SENTENCE_END.split(value.strip()):
+        while len(sentence) > room():
+            # A single sentence that is still too long: cut at the last space that fits
+            cut = sentence.rfind(" ", 0, room())
+            cut = cut if cut > 0 else room()
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + 1 + len(sentence) > room():
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return [f"{label}: {piece}" if label else piece for piece in pieces]
+
+
+def _row_chunks(doc, max_chars: int) -> list:
+    """The row's text as-is when it fits, otherwise field lines packed into chunks under the record header."""
+    if len(doc.text) <= max_chars:
+        return [doc.text]
+
+    header, *fields = doc.text.split("\n")
+    title = record_title(doc)
+    title_line = next((line for line in fields if title and line.endswith(f": {title}")), None)
+    # Each continuation repeats the header and the record's name so it reads on its own
+    preamble = "\n".join(line for line in (header, title_line) if line)
+
+    room = max_chars - len(preamble) - 1  # For a line following a continuation's preamble
+    chunks, current = [], [header]
+    for line in fields:
+        pieces = [line]
+        left = max_chars - len("\n".join(current)) - 1
+        # A line that overflows the first chunk is cut to fill it, so the lines it opens with
+        # (header, ID, name) are not flushed as a chunk of their own
+        fill = not chunks and room // 2 <= left < len(line)
+        if len(line) > room or fill:
+            label, separator, value = line.partition(": ")
+            if not separator:
+                label, value = "", line  # Not a field line (e.g. wrapped text): split it as plain text
+            pieces = _split_value(label, value, room, first_chars=min(left, room) if fill else None)
+        for piece in pieces:
+            if len(current) > 1 and len("\n".join(current + [piece])) > max_chars:
+                chunks.append("\n".join(current))
+                current = [preamble] if piece != title_line else [header]
+            current.append(piece)
+    chunks.append("\n".join(current))
+    return chunks
+
+
+def build_nodes(documents, max_chars=NODE_MAX_CHARS) -> list:
+    """One node per row from sqlite_loader, splitting only rows longer than max_chars along field lines.
+
+    Node IDs are "<doc_id>#<n>", so re-indexing a row yields the same IDs.
+    """
+    nodes = []
+    for doc in documents:
+        for i, text in enumerate(_row_chunks(doc, max_chars)):
+            node = TextNode(
+                id_=f"{doc.doc_id}#{i}",
+                text=text,
+                metadata=dict(doc.metadata),
+                excluded_embed_metadata_keys=list(doc.excluded_embed_metadata_keys),
+                excluded_llm_metadata_keys=list(doc.excluded_llm_metadata_keys),
+            )
+            node.relationships[NodeRelationship.SOURCE] = doc.as_related_node_info()
+            nodes.append(node)
+    return nodes
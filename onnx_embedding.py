@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+E5 embeddings through ONNX Runtime, and the script that exports the model for it.
+
+    python onnx_embedding.py
+
+exports EMBED_MODEL_NAME to ONNX_MODEL_DIR (mean pooling and normalization included in
+the graph), writes an int8-quantized copy, and checks both against the PyTorch
+embeddings. Serving with EMBED_BACKEND=onnx then loads only onnxruntime and tokenizers.
+"""
+
+import argparse
+import json
+import os
+import time
+from itertools import islice
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import (
+    DB_PATH, EMBED_MODEL_NAME, EMBED_BATCH_SIZE, ONNX_MODEL_DIR, ONNX_QUANTIZED, ONNX_PARITY_MIN_COSINE,
+)
+from embedding_base import E5Embedding
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+EXPORT_META_FILE = "export_meta.json"
+MAX_LENGTH = 512  # E5's position limit, the same truncation transformers applies
+
+# Checked for parity alongside sample rows from the database
+PARITY_QUERIES = [
+    "how to treat late blight in potato",
+    "best time to sow rice",
+    "yellow leaves on wheat",
+    "which tractor for a small farm",
+    "organic control of aphids on mustard",
+    "drip irrigation cost per acre",
+]
+
+
+def onnx_model_path(model_dir=ONNX_MODEL_DIR, quantized=ONNX_QUANTIZED):
+    return os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+
+
+def read_export_meta(model_dir=ONNX_MODEL_DIR) -> dict:
+    try:
+        with open(os.path.join(model_dir, EXPORT_META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class OnnxE5Embedding(E5Embedding):
+    """E5 from an export made by this script, run by ONNX Runtime on CPU."""
+
+    _session: Optional[object] = None
+    _tokenizer: Optional[object] = None
+    _input_names: Optional[set] = None
+
+    def __init__(self, model_name=EMBED_MODEL_NAME, batch_size=EMBED_BATCH_SIZE, threads=None,
+                 model_dir=ONNX_MODEL_DIR, quantized=ONNX_QUANTIZED):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        super().__init__(model_name=model_name, batch_size=batch_size)
+        path = onnx_model_path(model_dir, quantized)
+        meta = read_export_meta(model_dir)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"ONNX embedding model missing: {path} (export it with: python onnx_embedding.py)")
+        if meta.get("model_name") != model_name:
+            raise ValueError(f"{path} was exported from {meta.get('model_name')}, not {model_name}; re-run onnx_embedding.py")
+        cosine = meta.get("parity", {}).get(os.path.basename(path))
+        if cosine is not None and cosine < ONNX_PARITY_MIN_COSINE:
+            print(f"[!] {path} failed its parity check (min cosine {cosine:.4f} < {ONNX_PARITY_MIN_COSINE})")
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        print(f"Loading embedding model: {path} on ONNX Runtime")
+        self._session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self._tokenizer.no_padding()
+        self._tokenizer.enable_truncation(MAX_LENGTH)
+
+    def _tokenize(self, texts: List[str]) -> Dict[str, list]:
+        encodings = self._tokenizer.encode_batch(texts)
+        return {
+            "input_ids": [encoding.ids for encoding in encodings],
+            "attention_mask": [encoding.attention_mask for encoding in encodings],
+            "token_type_ids": [encoding.type_ids for encoding in encodings],
+        }
+
+    def _encode(self, features: Dict[str, list]) -> np.ndarray:
+        length = max(len(ids) for ids in features["input_ids"])
+        inputs = {}
+        for name, rows in features.items():
+            if name in self._input_names:
+                # Padding is masked out by attention_mask, so its token ID doesn't matter
+                batch = np.zeros((len(rows), length), dtype=np.int64)
+                for i, row in enumerate(rows):
+                    batch[i, :len(row)] = row
+                inputs[name] = batch
+        return self._session.run(None, inputs)[0]
+
+
+def export_onnx(model_name=EMBED_MODEL_NAME, model_dir=ONNX_MODEL_DIR, quantize=True):
+    """Write model.onnx (and model.int8.onnx) returning normalized, mean-pooled embeddings."""
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+
+    class PooledE5(torch.nn.Module):
+        def __init__(self, model, input_names):
+            super().__init__()
+            self.model = model
+            self.input_names = input_names
+
+        def forward(self, *inputs):
+            kwargs = dict(zip(self.input_names, inputs))
+            token_embeddings = self.model(**kwargs)[0]
+            mask = kwargs["attention_mask"].unsqueeze(-1).to(token_embeddings.dtype)
+            pooled = (token_embeddings * mask).sum(1) / mask.sum(1)
+            return torch.nn.functional.normalize(pooled, p=2, dim=1)
+
+    print(f"Exporting {model_name} to {model_dir}")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    # Eager attention traces to plain ops; SDPA's shape checks would be frozen into the graph
+    model = AutoModel.from_pretrained(model_name, attn_implementation="eager")
+    model.eval()
+    os.makedirs(model_dir, exist_ok=True)
+
+    sample = tokenizer(PARITY_QUERIES[:2], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["embedding"] = {0: "batch"}
+    with torch.inference_mode():
+        torch.onnx.export(
+            PooledE5(model, input_names),
+            tuple(sample[name] for name in input_names),
+            os.path.join(model_dir, ONNX_FILE),
+            input_names=input_names,
+            output_names=["embedding"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    tokenizer.backend_tokenizer.save(os.path.join(model_dir, TOKENIZER_FILE))
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(
+            os.path.join(model_dir, ONNX_FILE), os.path.join(model_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8
+        )
+    write_export_meta(model_dir, {"model_name": model_name, "parity": {}})
+
+
+def write_export_meta(model_dir, meta):
+    with open(os.path.join(model_dir, EXPORT_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def parity_texts(db_path=DB_PATH, samples=200) -> List[str]:
+    """The fixed queries plus the first rows of the database, as they are embedded for the index."""
+    texts = list(PARITY_QUERIES)
+    if os.path.exists(db_path):
+        from llama_index.core.schema import MetadataMode
+        from sqlite_loader import iter_sqlite_documents
+        texts += [doc.get_content(metadata_mode=MetadataMode.EMBED) for doc in islice(iter_sqlite_documents(db_path), samples)]
+    return texts
+
+
+def query_latency_ms(embed_model, queries=PARITY_QUERIES, rounds=5) -> float:
+    """Mean time to embed one uncached query."""
+    embed_model._get_embedding(queries[0])  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for query in queries:
+            embed_model._get_embedding(query)
+    return (time.perf_counter() - start) * 1000 / (rounds * len(queries))
+
+
+def parity_check(model_name=EMBED_MODEL_NAME, model_dir=ONNX_MODEL_DIR, texts=None) -> Dict[str, dict]:
+    """Lowest cosine similarity to the PyTorch embedding, and query latency, for each exported model."""
+    from embed_and_index import E5SmallV2Embedding
+
+    texts = texts or parity_texts()
+    reference = E5SmallV2Embedding(model_name)
+    expected = reference._embed_batch(texts)
+    results = {"torch": {"min_cosine": 1.0, "query_ms": query_latency_ms(reference)}}
+    for quantized in (False, True):
+        if not os.path.exists(onnx_model_path(model_dir, quantized)):
+            continue
+        embed_model = OnnxE5Embedding(model_name, model_dir=model_dir, quantized=quantized)
+        # Both sides are unit vectors, so the row-wise dot product is the cosine
+        cosine = float(np.min(np.sum(expected * embed_model._embed_batch(texts), axis=1)))
+        results[os.path.basename(onnx_model_path(model_dir, quantized))] = {
+            "min_cosine": cosine,
+            "query_ms": query_latency_ms(embed_model),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the E5 embedding model to ONNX and check it against PyTorch.")
+    parser.add_argument("--model", default=EMBED_MODEL_NAME, help="Hugging Face model to export")
+    parser.add_argument("--output", default=ONNX_MODEL_DIR, help="directory to write the ONNX models to")
+    parser.add_argument("--no-quantize", action="store_true", help="skip the int8 copy")
+    parser.add_argument("--check-only", action="store_true", help="re-run the parity check on an existing export")
+    parser.add_argument("--db", default=DB_PATH, help="database whose rows are used for the parity check")
+    parser.add_argument("--samples", type=int, default=200, help="database rows in the parity check")
+    parser.add_argument("--min-cosine", type=float, default=ONNX_PARITY_MIN_COSINE,
+                        help="lowest acceptable cosine similarity to PyTorch")
+    args = parser.parse_args()
+
+    if not args.check_only:
+        export_onnx(args.model, args.output, quantize=not args.no_quantize)
+
+    texts = parity_texts(args.db, args.samples)
+    print(f"Checking parity on {len(texts)} texts")
+    results = parity_check(args.model, args.output, texts)
+    meta = read_export_meta(args.output)
+    meta["parity"] = {name: round(result["min_cosine"], 6) for name, result in results.items() if name != "torch"}
+    write_export_meta(args.output, meta)
+
+    print(f"{'model':>16} {'min cosine':>11} {'ms/query':>9}")
+    for name, result in results.items():
+        print(f"{name:>16} {result['min_cosine']:>11.4f} {result['query_ms']:>9.2f}")
+
+    failed = [name for name, cosine in meta["parity"].items() if cosine < args.min_cosine]
+    if failed:
+        print(f"❌ Below {args.min_cosine} cosine: {', '.join(failed)}. Don't serve these with EMBED_BACKEND=onnx.")
+        raise SystemExit(1)
+    print("✅ Parity OK. Serve with EMBED_BACKEND=onnx.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+
+class QueryEmbeddingBatcher:
+    """Coalesces query embeddings from concurrent requests into shared forward passes.
+
+    Callers block on a Future while a single background thread collects queries for
+    at most `max_wait_ms` (or until `max_batch_size` are waiting) and embeds them together.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List], max_batch_size: int = 16, max_wait_ms: float = 2.0):
+        self._embed_fn = embed_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._queries = 0
+        self._worker = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str):
+        return self.submit(text).result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "queries": self._queries,
+                "avg_batch_size": round(self._queries / self._batches, 2) if self._batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                vectors = self._embed_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+            with self._lock:
+                self._batches += 1
+                self._queries += len(batch)
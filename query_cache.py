@@ -0,0 +1,155 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form used as a cache key: NFC, case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with hit/miss counters."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class AnswerCache:
+    """Generated answers keyed on the normalized question, with TTL and size eviction.
+
+    Besides exact matches, a near-duplicate tier returns the answer of a cached
+    question whose query embedding has cosine similarity >= `similarity_threshold`.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # key -> (answer, unit embedding or None, stored_at)
+        self._matrix = None  # Stacked embeddings for the near-duplicate tier, rebuilt lazily
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _expire(self, now: float):
+        expired = [key for key, (_, _, stored_at) in self._entries.items() if now - stored_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _similar_key(self, embedding):
+        if self._matrix is None:
+            self._matrix_keys = [key for key, (_, emb, _) in self._entries.items() if emb is not None]
+            self._matrix = np.stack([self._entries[key][1] for key in self._matrix_keys]) if self._matrix_keys else None
+        if self._matrix is None:
+            return None
+        scores = self._matrix @ embedding
+        best = int(np.argmax(scores))
+        return self._matrix_keys[best] if scores[best] >= self.similarity_threshold else None
+
+    def get(self, question: str, embed_fn=None):
+        """Return a cached answer or None; `embed_fn` is only called if the exact tier misses."""
+        key = normalize_query(question)
+        with self._lock:
+            self._expire(time.time())
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return self._entries[key][0]
+
+        if embed_fn is not None and self.similarity_threshold <= 1.0:
+            embedding = _unit(embed_fn())
+            with self._lock:
+                similar = self._similar_key(embedding)
+                if similar is not None and similar in self._entries:
+                    self._entries.move_to_end(similar)
+                    self.similar_hits += 1
+                    return self._entries[similar][0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, question: str, answer: str, embedding=None):
+        if self.max_size <= 0:
+            return
+        key = normalize_query(question)
+        with self._lock:
+            self._entries[key] = (answer, _unit(embedding) if embedding is not None else None, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        """Drop every answer, e.g. after the index was rebuilt."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.similarity_threshold,
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.similar_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY)
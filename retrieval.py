@@ -0,0 +1,156 @@
+import logging
+import re
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.settings import Settings
+from config import (
+    RETRIEVAL_TOP_K, ROUTER_MAX_TABLES, ROUTER_MARGIN, ROUTER_KEYWORD_BOOST,
+    HYBRID_RETRIEVAL, LEXICAL_TOP_K, RRF_K,
+)
+from query_cache import normalize_query
+
+logger = logging.getLogger()
+
+# Column words too generic to say anything about which table a question is about
+GENERIC_WORDS = {"id", "name", "title", "description", "type", "of", "the", "and", "from", "date"}
+# Rows per table whose field labels feed table_keywords
+KEYWORD_SAMPLE_ROWS = 20
+
+
+def _word_forms(word: str) -> set:
+    """A word plus a crude singular/plural variant, so "pest" matches "pests"."""
+    if word.endswith("ies"):
+        return {word, word[:-3] + "y"}
+    if word.endswith("s"):
+        return {word, word[:-1]}
+    return {word, word + "s"}
+
+
+def table_keywords(table: str, documents) -> set:
+    """Keywords for routing: the table name's words plus the field labels of its records."""
+    keywords = set()
+    for word in table.lower().split("_"):
+        keywords |= _word_forms(word)
+
+    labels = set()
+    for doc in documents[:KEYWORD_SAMPLE_ROWS]:
+        for line in doc.text.splitlines()[1:]:
+            label = line.split(":", 1)[0].split(" (from ", 1)[0]
+            labels.add(label.lower())
+    for label in labels:
+        for word in re.findall(r"[a-z]+", label):
+            if len(word) > 2 and word not in GENERIC_WORDS:
+                keywords |= _word_forms(word)
+    return keywords
+
+
+class TableRouter:
+    """Picks the tables worth searching for a query.
+
+    Each table scores the cosine similarity between the query and the table's embedding
+    centroid, plus ROUTER_KEYWORD_BOOST per keyword of the table found in the query
+    (double for words of the table name). The best table is always searched, along
+    with any other within `margin` of it, up to `max_tables`.
+    """
+
+    def __init__(self, profiles: dict, max_tables=ROUTER_MAX_TABLES, margin=ROUTER_MARGIN,
+                 keyword_boost=ROUTER_KEYWORD_BOOST):
+        self.tables = [table for table, profile in profiles.items() if profile.get("centroid")]
+        self.centroids = np.array([profiles[table]["centroid"] for table in self.tables], dtype=np.float32)
+        self.keywords = {table: set(profiles[table].get("keywords", [])) for table in self.tables}
+        self.name_words = {table: set(table.lower().split("_")) for table in self.tables}
+        self.max_tables = max_tables
+        self.margin = margin
+        self.keyword_boost = keyword_boost
+
+    def route(self, query: str, query_embedding) -> list:
+        if not self.tables:
+            return []
+        words = set()
+        for word in normalize_query(query).split():
+            words |= _word_forms(word.strip("?.,!"))
+
+        scores = self.centroids @ np.asarray(query_embedding, dtype=np.float32)
+        for i, table in enumerate(self.tables):
+            scores[i] += self.keyword_boost * (len(words & self.keywords[table]) + len(words & self.name_words[table]))
+
+        order = np.argsort(-scores)
+        best = scores[order[0]]
+        return [self.tables[i] for i in order[:self.max_tables] if scores[i] >= best - self.margin]
+
+
+class TableRoutedRetriever(BaseRetriever):
+    """Searches only the per-table sub-indexes the router picks for each query."""
+
+    def __init__(self, index, top_k=RETRIEVAL_TOP_K):
+        super().__init__()
+        self.top_k = top_k
+        self.router = TableRouter(index.profiles)
+        self._retrievers = {table: idx.as_retriever(similarity_top_k=top_k) for table, idx in index.indexes.items()}
+
+    def _retrieve(self, query_bundle):
+        if query_bundle.embedding is None:
+            query_bundle.embedding = Settings.embed_model.get_query_embedding(query_bundle.query_str)
+
+        tables = [t for t in self.router.route(query_bundle.query_str, query_bundle.embedding) if t in self._retrievers]
+        logger.info(f"[🧭] Routed query to tables: {tables}")
+
+        nodes = []
+        for table in tables:
+            nodes.extend(self._retrievers[table].retrieve(query_bundle))
+        nodes.sort(key=lambda node: node.score or 0.0, reverse=True)
+        return nodes[:self.top_k]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses BM25 hits from the FTS5 index with dense hits using reciprocal rank fusion.
+
+    When the question is nothing but the full title of one record (e.g. "Late blight?"),
+    that record is returned straight from the lexical index without a vector search.
+    """
+
+    def __init__(self, index, dense_retriever, top_k=RETRIEVAL_TOP_K, lexical_top_k=LEXICAL_TOP_K, rrf_k=RRF_K):
+        super().__init__()
+        self.index = index
+        self.dense = dense_retriever
+        self.top_k = top_k
+        self.lexical_top_k = lexical_top_k
+        self.rrf_k = rrf_k
+
+    def _retrieve(self, query_bundle):
+        hits = self.index.lexical.search(query_bundle.query_str, self.lexical_top_k)
+        exact = self.index.lexical.exact_match(query_bundle.query_str, hits)
+        if exact is not None:
+            nodes = self.index.nodes_for_doc(exact)
+            if nodes:
+                logger.info(f"[🎯] Exact lexical match: {exact}")
+                return [NodeWithScore(node=node, score=1.0) for node in nodes]
+
+        fused = {}  # node_id -> [NodeWithScore, fused score]
+        for rank, scored in enumerate(self.dense.retrieve(query_bundle), start=1):
+            fused[scored.node.node_id] = [scored, 1.0 / (self.rrf_k + rank)]
+        for rank, (doc_id, _, _, _) in enumerate(hits, start=1):
+            for node in self.index.nodes_for_doc(doc_id):
+                if node.node_id not in fused:
+                    fused[node.node_id] = [NodeWithScore(node=node, score=self._similarity(query_bundle, node)), 0.0]
+                fused[node.node_id][1] += 1.0 / (self.rrf_k + rank)
+
+        # Ordered by fused rank, but each node keeps its own cosine score, so the
+        # score cutoffs in build_prompt mean the same thing as for pure vector search
+        ranked = sorted(fused.values(), key=lambda entry: entry[1], reverse=True)[:self.top_k]
+        return [scored for scored, _ in ranked]
+
+    def _similarity(self, query_bundle, node) -> float:
+        vector = self.index.node_vector(node)
+        if vector is None or query_bundle.embedding is None:
+            return 0.0
+        return float(np.dot(np.asarray(vector, dtype=np.float32), np.asarray(query_bundle.embedding, dtype=np.float32)))
+
+
+def build_retriever(index, top_k=RETRIEVAL_TOP_K):
+    """Long-lived retriever returning scored nodes; built once at startup and shared by requests."""
+    retriever = TableRoutedRetriever(index, top_k)
+    if HYBRID_RETRIEVAL and index.lexical is not None:
+        retriever = HybridRetriever(index, retriever, top_k)
+    return retriever
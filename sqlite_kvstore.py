@@ -0,0 +1,363 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+from llama_index.core.schema import BaseNode, NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.storage.docstore.types import BaseDocumentStore, RefDocInfo
+from llama_index.core.storage.index_store.keyval_index_store import KVIndexStore
+from llama_index.core.storage.kvstore.types import BaseKVStore, DEFAULT_BATCH_SIZE, DEFAULT_COLLECTION
+from config import SQLITE_MMAP_SIZE
+
+STORAGE_DB_FILE = "storage.db"
+NODE_COLUMNS = "node_id, ref_doc_id, text, metadata, excluded"
+# IDs bound per "IN (...)" query, well under SQLite's host parameter limit (999 before 3.32)
+IN_BATCH_SIZE = 500
+
+
+class SQLiteKVStore(BaseKVStore):
+    """LlamaIndex key-value store in a single SQLite file, read through a memory map.
+
+    Values are parsed only when asked for, so nothing is loaded up front, and read-only
+    connections from several worker processes share the page cache of one file.
+    """
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        if readonly:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            self._conn.execute("PRAGMA query_only = ON")
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (collection, key)) WITHOUT ROWID"
+            )
+        self._conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        self._lock = threading.Lock()
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put_all([(key, val)], collection)
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection)
+
+    def put_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        if self.readonly:
+            return  # Opening an index re-saves its struct unchanged; keep what is on disk
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)",
+                ((collection, key, json.dumps(val)) for key, val in kv_pairs),
+            )
+
+    async def aput_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                       batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self.put_all(kv_pairs, collection, batch_size)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE collection = ? AND key = ?", (collection, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM kv WHERE collection = ?", (collection,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key))
+        return cursor.rowcount > 0
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection)
+
+    def query(self, sql, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()) -> int:
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def executemany(self, sql, rows):
+        with self._lock:
+            self._conn.executemany(sql, rows)
+
+    def commit(self):
+        if not self.readonly:
+            with self._lock:
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CompactDocumentStore(BaseDocumentStore):
+    """Node store with one row per node: vector ID, node ID, source row ID, text and metadata.
+
+    vector_id is the node's ID in the FAISS index (see FaissStore), so a search hit is
+    resolved by primary key, and the source row -> nodes mapping is an index on ref_doc_id.
+    None of these mappings is held in memory; rows are read only when a query hits them.
+    """
+
+    def __init__(self, kvstore: SQLiteKVStore):
+        self._kv = kvstore
+        if not kvstore.readonly:
+            kvstore.execute(
+                "CREATE TABLE IF NOT EXISTS nodes ("
+                "vector_id INTEGER PRIMARY KEY, node_id TEXT NOT NULL UNIQUE, ref_doc_id TEXT, "
+                "text TEXT NOT NULL, metadata TEXT NOT NULL, excluded TEXT NOT NULL)"
+            )
+            kvstore.execute("CREATE INDEX IF NOT EXISTS idx_nodes_ref_doc_id ON nodes (ref_doc_id)")
+            kvstore.execute(
+                "CREATE TABLE IF NOT EXISTS doc_hashes (doc_id TEXT PRIMARY KEY, hash TEXT NOT NULL) WITHOUT ROWID"
+            )
+
+    @staticmethod
+    def _to_node(node_id, ref_doc_id, text, metadata, excluded) -> TextNode:
+        embed_excluded, llm_excluded = json.loads(excluded)
+        node = TextNode(
+            id_=node_id,
+            text=text,
+            metadata=json.loads(metadata),
+            excluded_embed_metadata_keys=embed_excluded,
+            excluded_llm_metadata_keys=llm_excluded,
+        )
+        if ref_doc_id is not None:
+            node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=ref_doc_id)
+        return node
+
+    @property
+    def docs(self) -> Dict[str, BaseNode]:
+        """Every node; reads the whole table, so only for debugging."""
+        rows = self._kv.query(f"SELECT {NODE_COLUMNS} FROM nodes")
+        return {row[0]: self._to_node(*row) for row in rows}
+
+    def add_documents(self, docs: Sequence[BaseNode], allow_update: bool = True,
+                      batch_size: int = DEFAULT_BATCH_SIZE, store_text: bool = True) -> None:
+        if not allow_update:
+            for node in docs:
+                if self.document_exists(node.node_id):
+                    raise ValueError(f"node_id {node.node_id} already exists. Set allow_update to True to overwrite.")
+        self.add_vector_nodes(docs, [None] * len(docs))
+
+    def add_vector_nodes(self, nodes: Sequence[BaseNode], vector_ids: Sequence[Optional[int]]) -> None:
+        """Store nodes under their vector IDs, replacing any node with the same ID."""
+        self._kv.executemany(
+            f"INSERT OR REPLACE INTO nodes (vector_id, {NODE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    vector_id,
+                    node.node_id,
+                    node.ref_doc_id,
+                    node.get_content(),
+                    json.dumps(node.metadata, separators=(",", ":")),
+                    json.dumps([node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys],
+                               separators=(",", ":")),
+                )
+                for vector_id, node in zip(vector_ids, nodes)
+            ),
+        )
+
+    def _query_in(self, sql: str, keys: Sequence) -> list:
+        """Rows of `sql` for every key, binding at most IN_BATCH_SIZE keys per query at "{}"."""
+        keys = list(keys)
+        rows = []
+        for start in range(0, len(keys), IN_BATCH_SIZE):
+            batch = keys[start:start + IN_BATCH_SIZE]
+            rows += self._kv.query(sql.format(",".join("?" * len(batch))), batch)
+        return rows
+
+    def get_vector_ids(self, node_ids: Sequence[str]) -> List[int]:
+        rows = self._query_in("SELECT vector_id FROM nodes WHERE node_id IN ({})", node_ids)
+        return [row[0] for row in rows]
+
+    def get_ref_doc_vector_ids(self, ref_doc_id: str) -> List[int]:
+        return [row[0] for row in self._kv.query("SELECT vector_id FROM nodes WHERE ref_doc_id = ?", (ref_doc_id,))]
+
+    def all_vector_ids(self) -> List[int]:
+        return [row[0] for row in self._kv.query("SELECT vector_id FROM nodes ORDER BY vector_id")]
+
+    def get_vector_nodes(self, vector_ids: Sequence[int]) -> Dict[int, TextNode]:
+        """vector ID -> node for the IDs that still have a node (deleted vectors have none)."""
+        rows = self._query_in(f"SELECT vector_id, {NODE_COLUMNS} FROM nodes WHERE vector_id IN ({{}})", vector_ids)
+        return {row[0]: self._to_node(*row[1:]) for row in rows}
+
+    def delete_vector_nodes(self, vector_ids: Sequence[int]) -> None:
+        self._kv.executemany("DELETE FROM nodes WHERE vector_id = ?", ((vector_id,) for vector_id in vector_ids))
+
+    def node_count(self) -> int:
+        return self._kv.query("SELECT COUNT(*) FROM nodes")[0][0]
+
+    async def async_add_documents(self, docs: Sequence[BaseNode], allow_update: bool = True,
+                                  batch_size: int = DEFAULT_BATCH_SIZE, store_text: bool = True) -> None:
+        self.add_documents(docs, allow_update, batch_size, store_text)
+
+    def get_document(self, doc_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        rows = self._kv.query(
+            f"SELECT {NODE_COLUMNS} FROM nodes WHERE node_id = ?", (doc_id,)
+        )
+        if not rows:
+            if raise_error:
+                raise ValueError(f"doc_id {doc_id} not found.")
+            return None
+        return self._to_node(*rows[0])
+
+    async def aget_document(self, doc_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        return self.get_document(doc_id, raise_error)
+
+    def get_nodes(self, node_ids: List[str], raise_error: bool = True) -> List[BaseNode]:
+        """The retrieved nodes in one query instead of one per ID, in the order asked for."""
+        rows = self._query_in(f"SELECT {NODE_COLUMNS} FROM nodes WHERE node_id IN ({{}})", node_ids)
+        found = {row[0]: row for row in rows}
+        nodes = []
+        for node_id in node_ids:
+            if node_id in found:
+                nodes.append(self._to_node(*found[node_id]))
+            elif raise_error:
+                raise ValueError(f"Node {node_id} not found")
+        return nodes
+
+    async def aget_nodes(self, node_ids: List[str], raise_error: bool = True) -> List[BaseNode]:
+        return self.get_nodes(node_ids, raise_error)
+
+    def delete_document(self, doc_id: str, raise_error: bool = True) -> None:
+        deleted = self._kv.execute("DELETE FROM nodes WHERE node_id = ?", (doc_id,))
+        self._kv.execute("DELETE FROM doc_hashes WHERE doc_id = ?", (doc_id,))
+        if not deleted and raise_error:
+            raise ValueError(f"doc_id {doc_id} not found.")
+
+    async def adelete_document(self, doc_id: str, raise_error: bool = True) -> None:
+        self.delete_document(doc_id, raise_error)
+
+    def document_exists(self, doc_id: str) -> bool:
+        return bool(self._kv.query("SELECT 1 FROM nodes WHERE node_id = ?", (doc_id,)))
+
+    async def adocument_exists(self, doc_id: str) -> bool:
+        return self.document_exists(doc_id)
+
+    def ref_doc_exists(self, ref_doc_id: str) -> bool:
+        return bool(self._kv.query("SELECT 1 FROM nodes WHERE ref_doc_id = ? LIMIT 1", (ref_doc_id,)))
+
+    async def aref_doc_exists(self, ref_doc_id: str) -> bool:
+        return self.ref_doc_exists(ref_doc_id)
+
+    def get_ref_doc_info(self, ref_doc_id: str) -> Optional[RefDocInfo]:
+        rows = self._kv.query(
+            "SELECT node_id, metadata FROM nodes WHERE ref_doc_id = ? ORDER BY rowid", (ref_doc_id,)
+        )
+        if not rows:
+            return None
+        return RefDocInfo(node_ids=[row[0] for row in rows], metadata=json.loads(rows[0][1]))
+
+    async def aget_ref_doc_info(self, ref_doc_id: str) -> Optional[RefDocInfo]:
+        return self.get_ref_doc_info(ref_doc_id)
+
+    def get_all_ref_doc_info(self) -> Optional[Dict[str, RefDocInfo]]:
+        infos = {}
+        rows = self._kv.query(
+            "SELECT ref_doc_id, node_id, metadata FROM nodes WHERE ref_doc_id IS NOT NULL ORDER BY rowid"
+        )
+        for ref_doc_id, node_id, metadata in rows:
+            if ref_doc_id not in infos:
+                infos[ref_doc_id] = RefDocInfo(metadata=json.loads(metadata))
+            infos[ref_doc_id].node_ids.append(node_id)
+        return infos
+
+    async def aget_all_ref_doc_info(self) -> Optional[Dict[str, RefDocInfo]]:
+        return self.get_all_ref_doc_info()
+
+    def delete_ref_doc(self, ref_doc_id: str, raise_error: bool = True) -> None:
+        deleted = self._kv.execute("DELETE FROM nodes WHERE ref_doc_id = ?", (ref_doc_id,))
+        self._kv.execute("DELETE FROM doc_hashes WHERE doc_id = ?", (ref_doc_id,))
+        if not deleted and raise_error:
+            raise ValueError(f"ref_doc_id {ref_doc_id} not found.")
+
+    async def adelete_ref_doc(self, ref_doc_id: str, raise_error: bool = True) -> None:
+        self.delete_ref_doc(ref_doc_id, raise_error)
+
+    def set_document_hash(self, doc_id: str, doc_hash: str) -> None:
+        self.set_document_hashes({doc_id: doc_hash})
+
+    async def aset_document_hash(self, doc_id: str, doc_hash: str) -> None:
+        self.set_document_hash(doc_id, doc_hash)
+
+    def set_document_hashes(self, doc_hashes: Dict[str, str]) -> None:
+        self._kv.executemany("INSERT OR REPLACE INTO doc_hashes (doc_id, hash) VALUES (?, ?)", doc_hashes.items())
+
+    async def aset_document_hashes(self, doc_hashes: Dict[str, str]) -> None:
+        self.set_document_hashes(doc_hashes)
+
+    def get_document_hash(self, doc_id: str) -> Optional[str]:
+        rows = self._kv.query("SELECT hash FROM doc_hashes WHERE doc_id = ?", (doc_id,))
+        return rows[0][0] if rows else None
+
+    async def aget_document_hash(self, doc_id: str) -> Optional[str]:
+        return self.get_document_hash(doc_id)
+
+    def get_all_document_hashes(self) -> Dict[str, str]:
+        # Same direction as KVDocumentStore: hash -> doc_id
+        return {doc_hash: doc_id for doc_id, doc_hash in self._kv.query("SELECT doc_id, hash FROM doc_hashes")}
+
+    async def aget_all_document_hashes(self) -> Dict[str, str]:
+        return self.get_all_document_hashes()
+
+    def delete_document_hash(self, doc_id: str) -> None:
+        self._kv.execute("DELETE FROM doc_hashes WHERE doc_id = ?", (doc_id,))
+
+    # A scan of the source rows is diffed against doc_hashes in SQL: the rows seen so far
+    # go into a temp table, so no process memory grows with the row count
+    def scan_document_hashes(self, doc_hashes: Dict[str, str]) -> Dict[str, Optional[str]]:
+        """Mark doc_hashes as seen by the current scan; returns the ones that differ from what
+        is stored, as doc_id -> stored hash (None for a new document)."""
+        self._kv.execute("CREATE TEMP TABLE IF NOT EXISTS scanned (doc_id TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        self._kv.executemany("INSERT OR REPLACE INTO temp.scanned (doc_id, hash) VALUES (?, ?)", doc_hashes.items())
+        placeholders = ",".join("?" * len(doc_hashes))
+        rows = self._kv.query(
+            "SELECT s.doc_id, h.hash FROM temp.scanned s LEFT JOIN doc_hashes h ON h.doc_id = s.doc_id "
+            f"WHERE s.doc_id IN ({placeholders}) AND h.hash IS NOT s.hash",
+            list(doc_hashes),
+        )
+        return dict(rows)
+
+    def unscanned_document_ids(self) -> List[str]:
+        """Stored documents the current scan did not see, i.e. deleted at the source; ends the scan."""
+        self._kv.execute("CREATE TEMP TABLE IF NOT EXISTS scanned (doc_id TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        rows = self._kv.query("SELECT doc_id FROM doc_hashes WHERE doc_id NOT IN (SELECT doc_id FROM temp.scanned)")
+        self._kv.execute("DROP TABLE temp.scanned")
+        self._kv.commit()  # The scan's reads hold a shared lock on storage.db until then
+        return [row[0] for row in rows]
+
+    # StorageContext.persist() calls persist() on each store; here that just commits
+    def persist(self, persist_path=None, fs=None) -> None:
+        self._kv.commit()
+
+    def close(self):
+        self._kv.close()
+
+
+class SQLiteIndexStore(KVIndexStore):
+    def persist(self, persist_path=None, fs=None) -> None:
+        self._kvstore.commit()
+
+
+def sqlite_storage(persist_dir, readonly=False):
+    """Docstore and index store of one index, sharing a connection to persist_dir/storage.db."""
+    if not readonly:
+        os.makedirs(persist_dir, exist_ok=True)
+    kvstore = SQLiteKVStore(os.path.join(persist_dir, STORAGE_DB_FILE), readonly)
+    return CompactDocumentStore(kvstore), SQLiteIndexStore(kvstore)
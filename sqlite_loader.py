@@ -1,57 +1,138 @@
 from llama_index.core.schema import Document
+import hashlib
 import sqlite3
+from config import SQLITE_MMAP_SIZE, LOAD_BATCH_SIZE, INDEX_EXCLUDED_TABLES
+
+# Bookkeeping fields kept on every document but never embedded or shown to the LLM
+INTERNAL_METADATA_KEYS = ["row_id", "content_hash", "record_hash"]
 
 def get_foreign_keys(cursor, table_name):
     cursor.execute(f"PRAGMA foreign_key_list({table_name})")
     return cursor.fetchall()
 
-def get_sqlite_db(db_path: str):
-    conn = sqlite3.connect(db_path)
+def get_primary_key(cursor, table_name):
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    pk_cols = [row for row in cursor.fetchall() if row[5] > 0]
+    return [row[1] for row in sorted(pk_cols, key=lambda row: row[5])]
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def record_body(text: str, key_labels) -> str:
+    """Record text without its primary key lines ("Crop id: 29"), so rows that differ only
+    in their key compare equal."""
+    return "\n".join(line for line in text.splitlines() if line.partition(": ")[0] not in key_labels)
+
+def connect_readonly(db_path: str):
+    """Read-only connection for loading: no write locks, pages served from a memory map."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    return conn
+
+def load_fk_lookup(cursor, ref_table, to_col):
+    """Map each value of ref_table.to_col to the first two fields of its (first) row.
+
+    Keys are compared as strings, the way SQLite's type affinity would match "3" to 3.
+    """
+    if to_col is None:
+        # FK declared against the referenced table's primary key without naming it
+        pk_cols = get_primary_key(cursor, ref_table)
+        to_col = pk_cols[0] if pk_cols else "rowid"
+    cursor.execute(f"SELECT {to_col}, * FROM {ref_table}")
+    join_col_names = [desc[0] for desc in cursor.description][1:]
+    lookup = {}
+    for key, *join_row in cursor.fetchall():
+        if key is not None:
+            lookup.setdefault(str(key), list(zip(join_col_names, join_row))[:2])
+    return lookup
+
+def iter_sqlite_documents(db_path: str, batch_size=LOAD_BATCH_SIZE):
+    """Yield one Document per row, reading each table in fetchmany batches.
+
+    Tables in INDEX_EXCLUDED_TABLES are skipped. Only the current batch and the
+    foreign-key lookup maps are held in memory.
+    """
+    conn = connect_readonly(db_path)
     cursor = conn.cursor()
+    rows_cursor = conn.cursor()
+    fk_lookups = {}  # (ref_table, to_col) -> lookup map, loaded once per referenced table
 
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-    tables = [row[0] for row in cursor.fetchall()]
-    documents = []
-
-    for table_name in tables:
-        try:
-            cursor.execute(f"SELECT * FROM {table_name}")
-            rows = cursor.fetchall()
-            col_names = [desc[0] for desc in cursor.description]
-            foreign_keys = get_foreign_keys(cursor, table_name)
-
-            for row in rows:
-                row_data = dict(zip(col_names, row))
-                field_lines = []
-
-                for col in col_names:
-                    val = row_data.get(col)
-                    if val is not None and str(val).strip():
-                        field_lines.append(f"{col.replace('_', ' ').capitalize()}: {val}")
-
-                # Inject FK join summary (only 1-2 fields max)
+    tables = [row[0] for row in cursor.fetchall() if row[0] not in INDEX_EXCLUDED_TABLES]
+
+    try:
+        for table_name in tables:
+            try:
+                pk_cols = get_primary_key(cursor, table_name)
+                foreign_keys = get_foreign_keys(cursor, table_name)
                 for fk in foreign_keys:
-                    from_col, ref_table, to_col = fk[3], fk[2], fk[4]
-                    fk_val = row_data.get(from_col)
-                    if fk_val:
+                    ref_table, to_col = fk[2], fk[4]
+                    if (ref_table, to_col) not in fk_lookups:
                         try:
-                            cursor.execute(f"SELECT * FROM {ref_table} WHERE {to_col} = ?", (fk_val,))
-                            join_row = cursor.fetchone()
-                            if join_row:
-                                join_col_names = [desc[0] for desc in cursor.description]
-                                join_data = dict(zip(join_col_names, join_row))
-                                for jcol, jval in list(join_data.items())[:2]:
-                                    if jval:
-                                        field_lines.append(f"{jcol.replace('_', ' ').capitalize()} (from {ref_table}): {jval}")
+                            fk_lookups[(ref_table, to_col)] = load_fk_lookup(cursor, ref_table, to_col)
                         except Exception as e:
                             print(f"[!] FK join failed: {e}")
+                            fk_lookups[(ref_table, to_col)] = {}
+
+                if pk_cols:
+                    rows_cursor.execute(f"SELECT * FROM {table_name}")
+                else:
+                    # No declared primary key: fall back to the implicit rowid
+                    rows_cursor.execute(f"SELECT rowid AS _rowid_, * FROM {table_name}")
+                col_names = [desc[0] for desc in rows_cursor.description]
+
+                while True:
+                    rows = rows_cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row_to_document(table_name, col_names, row, pk_cols, foreign_keys, fk_lookups)
 
-                doc_text = f"Record from {table_name} table:\n" + "\n".join(field_lines)
-                documents.append(Document(text=doc_text, metadata={"table": table_name}))
+            except Exception as e:
+                print(f"[!] Error reading table '{table_name}': {e}")
+                continue
+    finally:
+        conn.close()
 
-        except Exception as e:
-            print(f"[!] Error reading table '{table_name}': {e}")
-            continue
+def row_to_document(table_name, col_names, row, pk_cols, foreign_keys, fk_lookups):
+    row_data = dict(zip(col_names, row))
+    if pk_cols:
+        row_id = ",".join(str(row_data.get(col)) for col in pk_cols)
+    else:
+        row_id = str(row_data.pop("_rowid_"))
+    field_lines = []
 
-    conn.close()
-    return documents
+    for col in col_names:
+        val = row_data.get(col)
+        if val is not None and str(val).strip():
+            field_lines.append(f"{col.replace('_', ' ').capitalize()}: {val}")
+
+    # Inject FK join summary (only 1-2 fields max)
+    for fk in foreign_keys:
+        from_col, ref_table, to_col = fk[3], fk[2], fk[4]
+        fk_val = row_data.get(from_col)
+        if fk_val:
+            for jcol, jval in fk_lookups[(ref_table, to_col)].get(str(fk_val), []):
+                if jval:
+                    field_lines.append(f"{jcol.replace('_', ' ').capitalize()} (from {ref_table}): {jval}")
+
+    doc_text = f"Record from {table_name} table:\n" + "\n".join(field_lines)
+    key_labels = {col.replace('_', ' ').capitalize() for col in pk_cols}
+    return Document(
+        id_=f"{table_name}:{row_id}",
+        text=doc_text,
+        metadata={
+            "table": table_name,
+            "row_id": row_id,
+            "content_hash": content_hash(doc_text),
+            # Equal for rows that are copies of one record under different keys
+            "record_hash": content_hash(record_body(doc_text, key_labels)),
+        },
+        excluded_embed_metadata_keys=list(INTERNAL_METADATA_KEYS),
+        excluded_llm_metadata_keys=list(INTERNAL_METADATA_KEYS),
+    )
+
+def get_sqlite_db(db_path: str):
+    """Every row as a Document, all in memory; prefer iter_sqlite_documents for large databases."""
+    return list(iter_sqlite_documents(db_path))